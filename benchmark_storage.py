@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Payment store write benchmark
+Simulates a launch: CONCURRENCY buyers at a time each record a pending payment
+and then its success (payment update + grant outbox insert), and reports
+payments/second per backend. "connect per write" is the path the bot used
+before payment_store.py. Postgres is included when DATABASE_URL is set.
+
+Usage:
+    python benchmark_storage.py
+    DATABASE_URL=postgresql://localhost/pouchon_bench python benchmark_storage.py
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import aiosqlite
+
+from payment_store import DATABASE_URL, SQLITE_SCHEMA, PostgresStore, SQLiteStore
+
+PAYMENTS = int(os.getenv("BENCHMARK_PAYMENTS", "3000"))
+CONCURRENCY = int(os.getenv("BENCHMARK_CONCURRENCY", "50"))
+
+class ConnectPerWrite:
+    """One connection and one commit per write, as record_pending_payment/record_successful_payment did"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def open(self):
+        async with aiosqlite.connect(self.path) as db:
+            for statement in SQLITE_SCHEMA:
+                await db.execute(statement)
+            await db.commit()
+
+    async def close(self):
+        pass
+
+    async def record_pending(self, payment: tuple):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute("INSERT OR REPLACE INTO payments VALUES (?, ?, ?, ?, ?, ?, ?, ?)", payment)
+            await db.commit()
+
+    async def record_success(self, reference, user_id, plan_type, phone, now):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute("UPDATE payments SET status = 'success' WHERE reference = ?", (reference,))
+            await db.execute(
+                """INSERT OR IGNORE INTO grant_outbox
+                (payment_reference, user_id, plan_type, phone_number, status, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)""",
+                (reference, user_id, plan_type, phone, now, now)
+            )
+            await db.commit()
+
+async def buy(store, number: int):
+    now = datetime.now().isoformat()
+    reference = f"bench_{number}"
+    user_id = 100000 + number
+    await store.record_pending((reference, user_id, 60, "KES", "pending", now, "kenya", "254700000000"))
+    await store.record_success(reference, user_id, "kenya", "254700000000", now)
+
+async def measure(store):
+    """Return payments per second and how many payments failed (e.g. "database is locked")"""
+    await store.open()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def limited(number):
+        async with semaphore:
+            await buy(store, number)
+
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(limited(number) for number in range(PAYMENTS)), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        return (PAYMENTS - failed) / (time.perf_counter() - start), failed
+    finally:
+        await store.close()
+
+async def main():
+    print(f"🧪 Payment store write benchmark ({PAYMENTS} payments, {CONCURRENCY} concurrent)\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [
+            ("connect per write", ConnectPerWrite(os.path.join(tmp, "before.db"))),
+            ("sqlite", SQLiteStore([os.path.join(tmp, "single.db")])),
+            ("sqlite-sharded x4", SQLiteStore([os.path.join(tmp, f"s4.shard{i}.db") for i in range(4)], wal=True)),
+            ("sqlite-sharded x8", SQLiteStore([os.path.join(tmp, f"s8.shard{i}.db") for i in range(8)], wal=True)),
+        ]
+        if DATABASE_URL:
+            backends.append(("postgres", PostgresStore(DATABASE_URL, schema=f"bench_{int(time.time())}")))
+
+        baseline = None
+        for label, store in backends:
+            rate, failed = await measure(store)
+            baseline = baseline or rate
+            print(f"{label:>20}: {rate:8.0f} payments/s  ({rate / baseline:.1f}x)"
+                  + (f"  ⚠️ {failed} failed" if failed else ""))
+            stats = store.stats() if hasattr(store, "stats") else None
+            if stats and stats.get("writes_per_commit"):
+                print(f"{'':>20}  {stats['writes_per_commit']} writes per commit")
+
+if __name__ == "__main__":
+    asyncio.run(main())
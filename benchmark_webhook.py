@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Webhook decode microbenchmark
+Compares per-request CPU of the old decode path (stdlib json + Update.de_json
+for every request) with the fast path in pouchon_bot.decode_webhook_body
+
+Only unhandled update types get cheaper: they skip Update.de_json entirely.
+Handled updates still pay for de_json, which dwarfs the orjson saving, so their
+before/after numbers are the same within run-to-run noise.
+"""
+
+import json
+import time
+
+from telegram import Bot, Update
+
+from pouchon_bot import decode_webhook_body
+
+ITERATIONS = 20000
+# Best of several interleaved runs, so background load doesn't favour either path
+REPEATS = 5
+
+with open("real_message.json", "rb") as f:
+    MESSAGE_BODY = f.read()
+
+# Traffic our handlers ignore: edited messages, channel posts, polls
+JUNK_BODY = json.dumps({
+    "update_id": 100000002,
+    "edited_message": json.loads(MESSAGE_BODY)["message"]
+}).encode()
+
+bot = Bot(token="123456:benchmark")
+
+def old_path(body: bytes):
+    data = json.loads(body)
+    return Update.de_json(data, bot)
+
+def new_path(body: bytes):
+    data = decode_webhook_body(body)
+    if data is None:
+        return None
+    return Update.de_json(data, bot)
+
+def measure(func, body: bytes) -> float:
+    """Return CPU microseconds per request"""
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        func(body)
+    return (time.process_time() - start) / ITERATIONS * 1_000_000
+
+if __name__ == "__main__":
+    print(f"🧪 Webhook decode benchmark ({ITERATIONS} requests each, best of {REPEATS})\n")
+    
+    for label, body in [("Text message", MESSAGE_BODY), ("Unhandled update", JUNK_BODY)]:
+        runs = [(measure(old_path, body), measure(new_path, body)) for _ in range(REPEATS)]
+        before = min(old for old, _ in runs)
+        after = min(new for _, new in runs)
+        print(f"{label}:")
+        print(f"   Before: {before:.1f} µs/request")
+        print(f"   After:  {after:.1f} µs/request")
+        print(f"   Saved:  {(1 - after / before) * 100:.0f}%\n")
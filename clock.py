@@ -0,0 +1,45 @@
+"""
+Time source for subscription logic
+Expiry, reminders, renewals, grant retries and invite link validity read the
+time from pouchon_bot.clock instead of datetime.now()/time.time(), so
+simulate_subscriptions.py can swap in a VirtualClock and run days of
+subscriptions in seconds. Shutdown deadlines and other wall-clock timeouts keep
+using time.monotonic().
+"""
+
+import asyncio
+import time
+from datetime import datetime
+
+class SystemClock:
+    def now(self, tz=None) -> datetime:
+        """Naive local time like datetime.now(), or aware when `tz` is given"""
+        return datetime.now(tz)
+
+    def time(self) -> float:
+        return time.time()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+class VirtualClock(SystemClock):
+    """Time that only moves when advanced; sleeping advances it instead of waiting"""
+
+    def __init__(self, start: float = None):
+        self.current = time.time() if start is None else start
+
+    def now(self, tz=None) -> datetime:
+        return datetime.fromtimestamp(self.current, tz)
+
+    def time(self) -> float:
+        return self.current
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+    def advance(self, seconds: float):
+        self.current += max(seconds, 0)
+
+    def advance_to(self, when: float):
+        self.current = max(self.current, when)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Online backups of subscriptions.db
+Snapshots are taken with VACUUM INTO, one read transaction that sees a single
+consistent state, then gzip-compressed into BACKUP_DIR. The bot's databases are
+in WAL mode (init_db and the payment store set it), so its commits go on while
+the snapshot is read; a database still on the rollback journal blocks writers
+for the whole copy.
+
+Usage:
+    python db_backup.py backup
+    python db_backup.py list
+    python db_backup.py restore backups/subscriptions-20250101-120000.db.gz
+    python db_backup.py --database subscriptions_brand.db backup   # a hosted bot's database
+"""
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+DATABASE_PATH = "subscriptions.db"
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+
+def snapshot_database(source_path: str, target_path: str):
+    """Write a consistent copy of a live database to a new file"""
+    # A stepped backup restarts whenever the bot writes mid-copy and may never finish
+    source = sqlite3.connect(source_path)
+    try:
+        source.execute("VACUUM INTO ?", (target_path,))
+    finally:
+        source.close()
+
+def copy_database(source_path: str, target_path: str):
+    """Overwrite target with source in one backup step (the bot is stopped for restores)"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+
+def backup_stem(database_path: str) -> str:
+    """Backups are named after their database, so several databases can share BACKUP_DIR"""
+    return os.path.splitext(os.path.basename(database_path))[0]
+
+def backup_pattern(database_path: str) -> re.Pattern:
+    # Anchored on the timestamp, so bot "brand" never claims bot "brand-eu"'s backups
+    return re.compile(rf"^{re.escape(backup_stem(database_path))}-\d{{8}}-\d{{6}}\.db\.gz$")
+
+def create_backup(database_path: str = DATABASE_PATH) -> str:
+    """Write a timestamped, compressed snapshot and return its path (blocking, run in a thread)"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    name = f"{backup_stem(database_path)}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db.gz"
+    backup_path = os.path.join(BACKUP_DIR, name)
+
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp:
+        snapshot = os.path.join(tmp, "snapshot.db")
+        snapshot_database(database_path, snapshot)
+        # Write under a temporary name so a half-written file never looks like a backup
+        with open(snapshot, "rb") as src, gzip.open(backup_path + ".tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    os.replace(backup_path + ".tmp", backup_path)
+    return backup_path
+
+def list_backups(database_path: str = DATABASE_PATH) -> list:
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    pattern = backup_pattern(database_path)
+    names = sorted(name for name in os.listdir(BACKUP_DIR) if pattern.match(name))
+    return [os.path.join(BACKUP_DIR, name) for name in names]
+
+def prune_backups(keep: int = BACKUP_KEEP, database_path: str = DATABASE_PATH) -> list:
+    """Delete all but the newest `keep` backups of one database"""
+    removed = list_backups(database_path)[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def restore_backup(backup_path: str, database_path: str = DATABASE_PATH):
+    """Restore a snapshot into the database file after checking its integrity"""
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "restore.db")
+        with gzip.open(backup_path, "rb") as src, open(snapshot, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+        check = sqlite3.connect(snapshot)
+        try:
+            result = check.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            check.close()
+        if result != "ok":
+            raise Exception(f"Backup failed integrity check: {result}")
+
+        copy_database(snapshot, database_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up and restore subscriptions.db")
+    parser.add_argument("--database", default=DATABASE_PATH, help="Database file (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backup", help="Take a snapshot now")
+    subparsers.add_parser("list", help="List snapshots")
+    restore = subparsers.add_parser("restore", help="Restore a snapshot (stop the bot first)")
+    restore.add_argument("backup_path")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        path = create_backup(args.database)
+        prune_backups(database_path=args.database)
+        print(f"✅ Backup written: {path}")
+    elif args.command == "list":
+        for path in list_backups(args.database):
+            print(f"{path}  ({os.path.getsize(path) // 1024} KB)")
+    elif args.command == "restore":
+        restore_backup(args.backup_path, args.database)
+        print(f"✅ Restored {args.database} from {args.backup_path}")
+
+if __name__ == "__main__":
+    sys.exit(main())
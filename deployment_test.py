@@ -2,6 +2,10 @@
 """
 Telegram Bot Deployment Readiness Test
 Tests if pouchon_bot.py is ready for Railway deployment
+
+The performance gate starts the bot against the stub APIs in traffic_replay.py
+and fails the run when import time, startup time, memory or webhook latency
+exceed the budgets in performance_budgets.json (skip it with --skip-performance).
 """
 
 import os
@@ -9,15 +13,27 @@ import sys
 import subprocess
 import importlib.util
 import ast
+import asyncio
+import json
 import re
+import socket
+import statistics
+import tempfile
+import time
 from pathlib import Path
 
+IMPORT_RUNS = 3
+# Commands the synthetic burst cycles through; /status also reads the database
+BURST_COMMANDS = ("/start", "/help", "/status")
+
 class DeploymentTester:
     def __init__(self):
         self.errors = []
         self.warnings = []
         self.bot_file = "pouchon_bot.py"
         self.requirements_file = "requirements.txt"
+        self.budgets_file = os.getenv("PERFORMANCE_BUDGETS_FILE", "performance_budgets.json")
+        self.budgets = None
         
     def print_status(self, test_name, status, message=""):
         """Print test status with colors"""
@@ -233,7 +249,180 @@ class DeploymentTester:
             self.print_status("Path configuration", "ERROR", f"Check failed: {e}")
             return False
 
-    def run_all_tests(self):
+    def test_traffic_anonymization(self):
+        """A recorded payment update must not carry raw ids, charge ids, contact details or invite links"""
+        try:
+            from traffic_replay import TrafficRecorder
+            user_id = 987654321
+            raw = {
+                "update_id": 1,
+                "message": {
+                    "message_id": 5, "date": 1700000000,
+                    "from": {"id": user_id, "is_bot": False, "first_name": "Amina", "username": "amina_k"},
+                    "chat": {"id": user_id, "type": "private", "first_name": "Amina"},
+                    "successful_payment": {
+                        "currency": "USD", "total_amount": 500,
+                        "invoice_payload": f"international:inv_{user_id}_1700000000",
+                        "telegram_payment_charge_id": "tg_charge_8f3a91",
+                        "provider_payment_charge_id": "ch_provider_77b2",
+                        "order_info": {"name": "Amina K", "email": "amina@example.com", "phone_number": "+254712345678",
+                                       "shipping_address": {"street_line1": "12 Moi Avenue", "city": "Nairobi"}},
+                    },
+                },
+                "chat_member": {"invite_link": {"invite_link": "https://t.me/+AbC_dEf123", "creator": {"id": user_id}}},
+            }
+            recorded = json.dumps(TrafficRecorder("", "check").anonymize(raw))
+            leaked = [value for value in (str(user_id), "tg_charge_8f3a91", "ch_provider_77b2", "Amina", "amina@",
+                                          "712345678", "Moi Avenue", "AbC_dEf123") if value in recorded]
+            if leaked:
+                self.print_status("Traffic anonymization", "ERROR", f"Raw values recorded: {leaked}")
+                self.errors.append(f"Traffic recorder leaks {leaked}")
+                return False
+            self.print_status("Traffic anonymization", "SUCCESS", "Payment update recorded without raw ids")
+            return True
+        except Exception as e:
+            self.print_status("Traffic anonymization", "ERROR", f"Check failed: {e}")
+            self.errors.append(f"Traffic anonymization check failed: {e}")
+            return False
+
+    def load_budgets(self):
+        """Performance budgets, or None (with a warning) when the file is missing or invalid"""
+        if self.budgets is None:
+            try:
+                with open(self.budgets_file, 'r') as f:
+                    self.budgets = json.load(f)
+            except (OSError, ValueError) as e:
+                self.print_status("Performance budgets", "WARNING", f"Not loaded, performance gate skipped: {e}")
+                self.warnings.append(f"Performance budgets not loaded from {self.budgets_file}")
+                self.budgets = {}
+        return self.budgets or None
+
+    def check_budget(self, test_name, key, value, unit):
+        """Compare a measurement with its budget; over budget fails the readiness check"""
+        budget = self.budgets.get(key)
+        if budget is None:
+            self.print_status(test_name, "INFO", f"{value:.2f}{unit} (no {key} budget)")
+            return True
+        if value > budget:
+            self.print_status(test_name, "ERROR", f"{value:.2f}{unit} exceeds budget of {budget}{unit}")
+            self.errors.append(f"{test_name} {value:.2f}{unit} over budget ({budget}{unit})")
+            return False
+        self.print_status(test_name, "SUCCESS", f"{value:.2f}{unit} (budget {budget}{unit})")
+        return True
+
+    def bot_environment(self, **overrides):
+        """Environment for a bot process that talks only to local stubs"""
+        env = dict(os.environ)
+        for name in ("WEBHOOK_URL", "WEBHOOK_SECRET_TOKEN", "BOTS_FILE", "PLANS_FILE", "TRAFFIC_RECORD_PATH",
+                     "ADMIN_USER_IDS"):
+            env.pop(name, None)
+        env.update({
+            "PYTHONPATH": os.path.abspath("."),
+            "LOG_LEVEL": "WARNING",
+            "BOT_TOKEN": "123456:perf",
+            "PAYSTACK_SECRET_KEY": "sk_test_perf",
+        })
+        env.update(overrides)
+        return env
+
+    def test_import_time(self):
+        """Cold import time of the bot module, median of fresh interpreters"""
+        if not self.load_budgets():
+            return True
+        try:
+            code = "import time; started = time.perf_counter(); import pouchon_bot; print(time.perf_counter() - started)"
+            timings = []
+            with tempfile.TemporaryDirectory() as workdir:
+                for _ in range(IMPORT_RUNS):
+                    result = subprocess.run(
+                        [sys.executable, "-c", code], cwd=workdir, env=self.bot_environment(),
+                        capture_output=True, text=True, timeout=120
+                    )
+                    if result.returncode != 0:
+                        raise Exception(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+                    timings.append(float(result.stdout.strip().splitlines()[-1]))
+            
+            within = self.check_budget("Import time", "import_seconds", statistics.median(timings), "s")
+            if not within:
+                self.print_slowest_imports()
+            return within
+        except Exception as e:
+            self.print_status("Import time", "ERROR", f"Check failed: {e}")
+            self.errors.append(f"Import time check failed: {e}")
+            return False
+
+    def print_slowest_imports(self, count=5):
+        """Top-level modules with the largest cumulative import time, from python -X importtime"""
+        with tempfile.TemporaryDirectory() as workdir:
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", "import pouchon_bot"], cwd=workdir,
+                env=self.bot_environment(), capture_output=True, text=True, timeout=120
+            )
+        modules = []
+        for line in result.stderr.splitlines():
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+            # Nesting is shown by two spaces per level; one level means imported directly by the bot
+            if match and len(match.group(2)) == 2:
+                modules.append((int(match.group(1)), match.group(3)))
+        for microseconds, name in sorted(modules, reverse=True)[:count]:
+            print(f"   {microseconds / 1000:8.1f} ms  {name}")
+
+    def test_runtime_budgets(self):
+        """Start the bot against stub APIs and measure startup, memory and webhook latency"""
+        if not self.load_budgets():
+            return True
+        stub_port, bot_port = free_port(), free_port()
+        processes = []
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                processes.append(subprocess.Popen(
+                    [sys.executable, "traffic_replay.py", "stub", "--port", str(stub_port)],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                ))
+                wait_for_port(stub_port, 30)
+                
+                env = self.bot_environment(
+                    PORT=str(bot_port),
+                    TELEGRAM_API_URL=f"http://127.0.0.1:{stub_port}/bot",
+                    PAYSTACK_API_URL=f"http://127.0.0.1:{stub_port}/paystack",
+                )
+                log_path = os.path.join(workdir, "bot.log")
+                with open(log_path, "w") as log:
+                    started = time.perf_counter()
+                    bot = subprocess.Popen([sys.executable, os.path.abspath(self.bot_file)], cwd=workdir, env=env,
+                                           stdout=log, stderr=subprocess.STDOUT)
+                    processes.append(bot)
+                    results = asyncio.run(measure_running_bot(bot, bot_port, started, self.budgets))
+                
+                if results.get("failure"):
+                    with open(log_path) as f:
+                        tail = f.read().strip().splitlines()[-5:]
+                    raise Exception(results["failure"] + "".join(f"\n   {line}" for line in tail))
+            
+            within = self.check_budget("Startup to ready", "startup_seconds", results["startup_seconds"], "s")
+            within &= self.check_budget("RSS after startup", "startup_rss_mb", results["startup_rss_mb"], " MB")
+            within &= self.check_budget(f"Webhook p95 ({results['updates']} updates)", "webhook_p95_ms",
+                                        results["webhook_p95_ms"], " ms")
+            within &= self.check_budget("RSS after burst", "burst_rss_mb", results["burst_rss_mb"], " MB")
+            if results["failed_updates"]:
+                self.print_status("Webhook burst", "ERROR", f"{results['failed_updates']} updates failed")
+                self.errors.append(f"{results['failed_updates']} webhook updates failed during the burst")
+                within = False
+            return within
+        except Exception as e:
+            self.print_status("Runtime performance", "ERROR", f"Check failed: {e}")
+            self.errors.append(f"Runtime performance check failed: {e}")
+            return False
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    def run_all_tests(self, performance=True):
         """Run all deployment readiness tests"""
         print("🚀 Running Telegram Bot Deployment Readiness Tests...\n")
         
@@ -246,8 +435,11 @@ class DeploymentTester:
             self.test_environment_variables,
             self.test_webhook_configuration,
             self.test_port_configuration,
-            self.test_database_paths
+            self.test_database_paths,
+            self.test_traffic_anonymization
         ]
+        if performance:
+            tests += [self.test_import_time, self.test_runtime_budgets]
         
         for test in tests:
             test()
@@ -284,7 +476,87 @@ class DeploymentTester:
             
         return len(self.errors) == 0
 
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise Exception(f"Nothing listening on port {port} after {timeout}s")
+
+def rss_mb(pid):
+    """Resident memory of a process in MB"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return int(subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout) / 1024
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+async def measure_running_bot(bot, port, started, budgets):
+    """Time to /health ready, then RSS before and after a burst of synthetic command updates"""
+    import httpx
+    
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + max(budgets.get("startup_seconds", 0) * 2, 30)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        while True:
+            if bot.poll() is not None:
+                return {"failure": f"Bot exited with code {bot.returncode} during startup"}
+            if time.perf_counter() > deadline:
+                return {"failure": "Bot never reported bot_ready on /health"}
+            try:
+                response = await client.get("/health")
+                if response.status_code == 200 and response.json().get("bot_ready"):
+                    break
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05)
+        results = {"startup_seconds": time.perf_counter() - started, "startup_rss_mb": rss_mb(bot.pid)}
+        
+        count = int(budgets.get("burst_updates", 1000))
+        limit = asyncio.Semaphore(int(budgets.get("burst_concurrency", 50)))
+        latencies, failed = [], 0
+        
+        async def send(number):
+            nonlocal failed
+            command = BURST_COMMANDS[number % len(BURST_COMMANDS)]
+            user = {"id": 7_000_000 + number % 200, "is_bot": False, "first_name": "Perf"}
+            update = {"update_id": 500_000_000 + number, "message": {
+                "message_id": number + 1, "from": user, "chat": dict(user, type="private"),
+                "date": int(time.time()), "text": command,
+                "entities": [{"offset": 0, "length": len(command), "type": "bot_command"}]
+            }}
+            async with limit:
+                sent = time.perf_counter()
+                try:
+                    response = await client.post("/telegram_webhook", json=update)
+                    if response.status_code != 200 or not response.json().get("ok"):
+                        failed += 1
+                except httpx.HTTPError:
+                    failed += 1
+                latencies.append((time.perf_counter() - sent) * 1000)
+        
+        await asyncio.gather(*(send(number) for number in range(count)))
+    
+    results.update(updates=count, failed_updates=failed, webhook_p95_ms=percentile(latencies, 0.95),
+                   burst_rss_mb=rss_mb(bot.pid))
+    return results
+
 if __name__ == "__main__":
     tester = DeploymentTester()
-    success = tester.run_all_tests()
+    success = tester.run_all_tests(performance="--skip-performance" not in sys.argv)
     sys.exit(0 if success else 1)
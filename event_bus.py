@@ -0,0 +1,78 @@
+"""
+In-process pub/sub for the live admin dashboard
+Each event is encoded once into a Server-Sent Events frame and the same bytes
+are handed to every subscriber, so fan-out costs one append per viewer. Every
+subscriber has a bounded buffer; a viewer that falls behind loses its oldest
+frames (and is told how many) instead of growing memory.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import orjson
+
+class Subscription:
+    __slots__ = ("frames", "dropped", "wakeup")
+
+    def __init__(self, buffer_size: int):
+        self.frames = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.wakeup = asyncio.Event()
+
+    def push(self, frame: bytes):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self.wakeup.set()
+
+    def drain(self) -> list:
+        frames = list(self.frames)
+        self.frames.clear()
+        self.wakeup.clear()
+        if self.dropped:
+            frames.insert(0, encode_frame(None, "dropped", {"count": self.dropped}))
+            self.dropped = 0
+        return frames
+
+def encode_frame(event_id, event_type: str, data: dict) -> bytes:
+    frame = b"id: %d\n" % event_id if event_id is not None else b""
+    return frame + b"event: " + event_type.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+class EventBus:
+    def __init__(self, buffer_size: int = 256, history_size: int = 100):
+        self.buffer_size = buffer_size
+        self.subscribers = set()
+        # Recent frames replayed to new viewers (and to reconnects via Last-Event-ID)
+        self.history = deque(maxlen=history_size)
+        self.last_id = 0
+        self.published = 0
+
+    def publish(self, event_type: str, **data):
+        """Fan an event out to every subscriber; never blocks and never awaits"""
+        self.last_id += 1
+        self.published += 1
+        data["ts"] = round(time.time(), 3)
+        frame = encode_frame(self.last_id, event_type, data)
+        self.history.append((self.last_id, frame))
+        for subscription in self.subscribers:
+            subscription.push(frame)
+
+    def subscribe(self, last_event_id: int = None) -> Subscription:
+        """Call from the event loop; the caller must unsubscribe when the stream ends"""
+        subscription = Subscription(self.buffer_size)
+        for event_id, frame in self.history:
+            if last_event_id is None or event_id > last_event_id:
+                subscription.push(frame)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "buffered_frames": sum(len(subscription.frames) for subscription in self.subscribers),
+        }
@@ -0,0 +1,76 @@
+"""
+Event-loop lag watchdog
+A coroutine measures how late its periodic wakeups are (loop lag). A helper
+thread watches the coroutine's heartbeat; if the loop stops turning for longer
+than the threshold, it captures the loop thread's stack while the blocking code
+is still running, so the log shows the offending coroutine.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+
+from sampling_profiler import frame_label
+
+logger = logging.getLogger(__name__)
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"lag_ms_last": 0.0, "lag_ms_max": 0.0, "stalls": 0, "last_stall_stack": None}
+
+    async def run(self, sleep=None):
+        """Heartbeat coroutine; `sleep(seconds)` may return True to stop (defaults to asyncio.sleep)"""
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+        try:
+            while True:
+                started = time.monotonic()
+                if sleep:
+                    if await sleep(self.interval):
+                        return
+                else:
+                    await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag_ms = max(now - started - self.interval, 0) * 1000
+                self.stats["lag_ms_last"] = round(lag_ms, 1)
+                self.stats["lag_ms_max"] = round(max(self.stats["lag_ms_max"], lag_ms), 1)
+                self.heartbeat = now
+        finally:
+            self.stop_event.set()
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self.stop_event.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            # Report each stall once, while the loop is still blocked inside it
+            if stalled < self.threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+
+            stack = self._loop_stack()
+            self.stats["stalls"] += 1
+            self.stats["last_stall_stack"] = stack
+            logger.warning(
+                "Event loop blocked",
+                extra={"blocked_ms": round(stalled * 1000), "stack": stack}
+            )
+
+    def _loop_stack(self) -> list:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame.f_code, frame.f_lineno))
+            frame = frame.f_back
+        return list(reversed(stack))
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Migrate data from earlier versions of the bot into the current schema
+Sources:
+    pouchon.db payments          (invoice_id, subscription_plan, access_ends_at, ...)
+    subscriptions.db legacy rows (user_id, plan, expires_at, reference, phone, active)
+A subscriptions table still in the legacy shape is renamed to legacy_subscriptions
+so the current schema can be created next to it.
+
+Rows are read in keyset-ordered chunks and upserted one transaction per chunk,
+together with a checkpoint, so the bot keeps running and an interrupted run
+resumes where it stopped. Re-running is a no-op.
+
+Rows land in subscriptions.db; with another STORAGE_BACKEND run
+migrate_storage.py afterwards to copy the payments into the store.
+
+Usage:
+    python migrate_legacy.py                 # migrate everything found
+    python migrate_legacy.py --dry-run       # count and normalize only
+    python migrate_legacy.py --restart       # ignore checkpoints
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from pouchon_bot import (PRIVATE_CHANNEL_ID, format_phone_for_paystack, init_db, is_legacy_subscriptions,
+                         validate_kenya_phone)
+
+DATABASE_PATH = "subscriptions.db"
+LEGACY_DATABASE_PATH = os.getenv("LEGACY_DATABASE_PATH", "pouchon.db")
+MIGRATION_CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "1000"))
+# Pause between chunks so the bot gets the write lock
+MIGRATION_CHUNK_SLEEP = float(os.getenv("MIGRATION_CHUNK_SLEEP", "0.05"))
+
+SUCCESS_STATUSES = {"success", "successful", "completed", "complete", "paid"}
+
+def normalize_timestamp(value):
+    """Naive local ISO timestamps, as the bot writes them; None when unparseable"""
+    if value in (None, ""):
+        return None
+    try:
+        if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+            seconds = float(value)
+            # Millisecond epochs from JavaScript-era rows
+            return datetime.fromtimestamp(seconds / 1000 if seconds > 1e11 else seconds).isoformat()
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00").replace(" ", "T", 1))
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+def normalize_phone(value):
+    if not value:
+        return None
+    phone = str(value).strip()
+    return format_phone_for_paystack(phone) if validate_kenya_phone(phone) else phone
+
+def normalize_plan(plan, currency) -> str:
+    plan = (plan or "").lower()
+    if any(word in plan for word in ("kenya", "kes", "mpesa", "m-pesa")):
+        return "kenya"
+    if any(word in plan for word in ("international", "usd", "card")):
+        return "international"
+    return "kenya" if (currency or "").upper() == "KES" else "international"
+
+def normalize_status(status) -> str:
+    status = (status or "").strip().lower()
+    return "success" if status in SUCCESS_STATUSES else status or "pending"
+
+def table_columns(db, table: str) -> set:
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+
+def prepare_target(target):
+    """Move a legacy-shaped subscriptions table aside and create the current schema"""
+    if is_legacy_subscriptions(table_columns(target, "subscriptions")):
+        if table_columns(target, "legacy_subscriptions"):
+            raise Exception("Both subscriptions and legacy_subscriptions are in the legacy shape")
+        target.execute("ALTER TABLE subscriptions RENAME TO legacy_subscriptions")
+        target.commit()
+        print("📦 Renamed legacy subscriptions table to legacy_subscriptions")
+
+    asyncio.run(init_db())
+    if "payment_reference" not in table_columns(target, "subscriptions"):
+        raise Exception("Current schema missing after init_db; see the log above")
+
+    target.execute("""
+    CREATE TABLE IF NOT EXISTS migration_progress (
+        source TEXT PRIMARY KEY,
+        last_key TEXT,
+        rows INTEGER,
+        updated_at TEXT
+    )
+    """)
+    target.commit()
+
+def legacy_payment_rows(row: dict, now: str):
+    """payments row, plus a subscription upsert for completed payments with an access window"""
+    plan_type = normalize_plan(row.get("subscription_plan"), row.get("currency"))
+    status = normalize_status(row.get("status"))
+    phone = normalize_phone(row.get("phone_number"))
+    amount = int(round(row.get("amount") or 0))
+    currency = (row.get("currency") or "").upper() or None
+    created_at = normalize_timestamp(row.get("requested_at")) or normalize_timestamp(row.get("completed_at"))
+    payment = (row["invoice_id"], row["user_id"], amount, currency, status, created_at, plan_type, phone)
+
+    expires_at = normalize_timestamp(row.get("access_ends_at"))
+    subscription = None
+    if status == "success" and expires_at and row.get("user_id"):
+        granted_at = normalize_timestamp(row.get("completed_at")) or created_at
+        subscription = (row["user_id"], plan_type, phone, row["invoice_id"], amount, currency,
+                        granted_at, expires_at, int(expires_at > now))
+    return payment, subscription
+
+def legacy_subscription_rows(row: dict, now: str):
+    expires_at = normalize_timestamp(row.get("expires_at"))
+    if not expires_at or not row.get("user_id"):
+        return None, None
+    plan_type = normalize_plan(row.get("plan"), None)
+    subscription = (row["user_id"], plan_type, normalize_phone(row.get("phone")), row.get("reference"),
+                    None, None, None, expires_at, int(bool(row.get("active")) and expires_at > now))
+    return None, subscription
+
+# source name -> (database, table, keyset column, row converter)
+SOURCES = {
+    "pouchon.payments": (LEGACY_DATABASE_PATH, "payments", "invoice_id", legacy_payment_rows),
+    "legacy_subscriptions": (DATABASE_PATH, "legacy_subscriptions", "user_id", legacy_subscription_rows),
+}
+
+def write_chunk(target, payments: list, subscriptions: list):
+    target.executemany(
+        """INSERT INTO payments (reference, user_id, amount, currency, status, created_at, plan_type, phone_number)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (reference) DO UPDATE SET status = excluded.status,
+            plan_type = COALESCE(plan_type, excluded.plan_type),
+            phone_number = COALESCE(phone_number, excluded.phone_number)""",
+        payments
+    )
+    # The latest access window per user wins, whatever order rows arrive in
+    target.executemany(
+        """INSERT INTO subscriptions (user_id, plan_type, phone_number, payment_reference, amount, currency,
+            access_granted_at, expires_at, active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET plan_type = excluded.plan_type,
+            phone_number = COALESCE(excluded.phone_number, phone_number),
+            payment_reference = excluded.payment_reference,
+            amount = COALESCE(excluded.amount, amount), currency = COALESCE(excluded.currency, currency),
+            access_granted_at = COALESCE(excluded.access_granted_at, access_granted_at),
+            expires_at = excluded.expires_at, active = excluded.active
+        WHERE excluded.expires_at > COALESCE(subscriptions.expires_at, '')""",
+        subscriptions
+    )
+    # Active legacy users are in the default channel; the sweeper removes them at expiry
+    target.executemany(
+        "INSERT OR IGNORE INTO subscription_channels (user_id, channel_id) VALUES (?, ?)",
+        [(subscription[0], PRIVATE_CHANNEL_ID) for subscription in subscriptions if subscription[8]]
+    )
+
+def migrate_source(target, name: str, chunk_size: int, dry_run: bool, restart: bool) -> dict:
+    database, table, key_column, convert = SOURCES[name]
+    # A dry run happens before prepare_target, so legacy rows may still be under their old name
+    if dry_run and name == "legacy_subscriptions" and \
+            is_legacy_subscriptions(table_columns(target, "subscriptions")):
+        table = "subscriptions"
+    stats = {"read": 0, "payments": 0, "subscriptions": 0, "skipped": 0}
+    if not os.path.exists(database):
+        return stats
+
+    source = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    source.row_factory = sqlite3.Row
+    try:
+        if not table_columns(source, table):
+            return stats
+
+        checkpoints = not restart and table_columns(target, "migration_progress")
+        progress = None if not checkpoints else target.execute(
+            "SELECT last_key, rows FROM migration_progress WHERE source = ?", (name,)
+        ).fetchone()
+        last_key, done = progress if progress else (None, 0)
+        if last_key is not None:
+            print(f"↪️  {name}: resuming after {key_column}={last_key} ({done} rows done)")
+
+        while True:
+            if last_key is None:
+                cursor = source.execute(f"SELECT * FROM {table} ORDER BY {key_column} LIMIT ?", (chunk_size,))
+            else:
+                cursor = source.execute(
+                    f"SELECT * FROM {table} WHERE {key_column} > ? ORDER BY {key_column} LIMIT ?",
+                    (last_key, chunk_size)
+                )
+            rows = [dict(row) for row in cursor]
+            if not rows:
+                break
+
+            now = datetime.now().isoformat()
+            payments, subscriptions = [], []
+            for row in rows:
+                payment, subscription = convert(row, now)
+                if payment:
+                    payments.append(payment)
+                if subscription:
+                    subscriptions.append(subscription)
+                if not payment and not subscription:
+                    stats["skipped"] += 1
+
+            last_key = rows[-1][key_column]
+            done += len(rows)
+            stats["read"] += len(rows)
+            stats["payments"] += len(payments)
+            stats["subscriptions"] += len(subscriptions)
+
+            if not dry_run:
+                # Rows and checkpoint commit together, so a crash never skips or half-applies a chunk
+                with target:
+                    write_chunk(target, payments, subscriptions)
+                    target.execute(
+                        "INSERT OR REPLACE INTO migration_progress (source, last_key, rows, updated_at) VALUES (?, ?, ?, ?)",
+                        (name, last_key, done, now)
+                    )
+                time.sleep(MIGRATION_CHUNK_SLEEP)
+    finally:
+        source.close()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy databases into subscriptions.db")
+    parser.add_argument("--dry-run", action="store_true", help="Read and normalize without writing")
+    parser.add_argument("--restart", action="store_true", help="Ignore checkpoints and start over")
+    parser.add_argument("--chunk-size", type=int, default=MIGRATION_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    target = sqlite3.connect(DATABASE_PATH, timeout=30)
+    try:
+        if not args.dry_run:
+            prepare_target(target)
+        for name in SOURCES:
+            stats = migrate_source(target, name, args.chunk_size, args.dry_run, args.restart)
+            print(f"{'🔎' if args.dry_run else '✅'} {name}: {stats['read']} read, {stats['payments']} payments, "
+                  f"{stats['subscriptions']} subscriptions, {stats['skipped']} skipped")
+    finally:
+        target.close()
+
+    if not args.dry_run:
+        print("ℹ️  Restart the bot to schedule expiry for newly imported active subscriptions")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Copy payments and grant outbox rows into the configured payment store
+With STORAGE_BACKEND=sqlite the store lives in each bot's own database. Other
+backends start empty, so rows written before the switch (including
+migrate_legacy.py imports) are copied over from every bot's database.
+Rows already in the store are kept; pending grants are dispatched by the
+new backend. Re-running is a no-op.
+
+Stop the bot first, set STORAGE_BACKEND (and DATABASE_URL for postgres), then:
+    python migrate_storage.py
+    python migrate_storage.py --chunk-size 500
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+
+from payment_store import STORAGE_BACKEND, STORE_COLUMNS, STORE_TABLES
+from pouchon_bot import bots
+from migrate_legacy import MIGRATION_CHUNK_SIZE, table_columns
+
+# Keyset column per store table in the bot's own database
+TABLE_KEYS = {"payments": "reference", "grant_outbox": "id"}
+
+async def migrate_bot(tenant, chunk_size: int) -> dict:
+    stats = dict.fromkeys(STORE_TABLES, (0, 0))
+    if tenant.store.files == (tenant.database,) or not os.path.exists(tenant.database):
+        return stats
+
+    source = sqlite3.connect(f"file:{tenant.database}?mode=ro", uri=True)
+    source.row_factory = sqlite3.Row
+    await tenant.store.open()
+    try:
+        for table in STORE_TABLES:
+            if not set(STORE_COLUMNS[table]) <= table_columns(source, table):
+                continue
+            key = TABLE_KEYS[table]
+            last_key, read, added = None, 0, 0
+            while True:
+                rows = source.execute(
+                    f"SELECT {key}, {', '.join(STORE_COLUMNS[table])} FROM {table} "
+                    f"{'' if last_key is None else f'WHERE {key} > ?'} ORDER BY {key} LIMIT ?",
+                    (chunk_size,) if last_key is None else (last_key, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                added += await tenant.store.import_rows(table, [dict(row) for row in rows])
+                read += len(rows)
+                last_key = rows[-1][key]
+            stats[table] = (read, added)
+    finally:
+        await tenant.store.close()
+        source.close()
+    return stats
+
+async def migrate(chunk_size: int):
+    for key, tenant in bots.items():
+        stats = await migrate_bot(tenant, chunk_size)
+        print(f"✅ {key}: " + ", ".join(
+            f"{table} {read} read, {added} added" for table, (read, added) in stats.items()
+        ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy payments into the STORAGE_BACKEND payment store")
+    parser.add_argument("--chunk-size", type=int, default=MIGRATION_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if STORAGE_BACKEND == "sqlite":
+        print("ℹ️  STORAGE_BACKEND=sqlite keeps payments in each bot's database; nothing to copy")
+        return
+    asyncio.run(migrate(args.chunk_size))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+"""
+Storage backends for the payment write path
+Every payment attempt inserts a payments row and every verified payment queues a
+grant_outbox row, so during a launch these writes dominate. They go through the
+store picked by STORAGE_BACKEND:
+    sqlite          in the bot's own database file (default)
+    sqlite-sharded  STORAGE_SHARDS files next to it, rows placed by a hash of user_id
+    postgres        DATABASE_URL via asyncpg (pip install asyncpg); one schema per bot
+
+Each SQLite file has one writer task that takes every write queued since its last
+commit and applies them in a single transaction, each under its own savepoint.
+Concurrent payments then share a commit (and its fsync) instead of queueing on
+the write lock one at a time, and more shards add more writers.
+
+After switching backends, stop the bot and run migrate_storage.py: until then
+payments and outbox rows written earlier (including migrate_legacy.py imports,
+which land in the bot's own database) are invisible to the new backend.
+"""
+
+import abc
+import asyncio
+import os
+import zlib
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+from subscription_archive import ARCHIVE_TABLES, append_rows, archive_table
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+STORAGE_SHARDS = int(os.getenv("STORAGE_SHARDS", "4"))
+# Most writes a writer task commits at once
+STORAGE_WRITE_BATCH = int(os.getenv("STORAGE_WRITE_BATCH", "100"))
+DATABASE_URL = os.getenv("DATABASE_URL")
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+
+# Tables owned by the store; the bot's database keeps everything else
+STORE_TABLES = ("payments", "grant_outbox")
+# Columns copied between backends; grant_outbox ids are assigned by the target
+STORE_COLUMNS = {
+    "payments": ("reference", "user_id", "amount", "currency", "status", "created_at", "plan_type", "phone_number"),
+    "grant_outbox": ("payment_reference", "user_id", "plan_type", "phone_number", "invite_link", "status",
+                     "attempts", "next_attempt_at", "last_error", "created_at"),
+}
+
+SQLITE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS payments (
+        reference TEXT PRIMARY KEY,
+        user_id INTEGER,
+        amount INTEGER,
+        currency TEXT,
+        status TEXT,
+        created_at TEXT,
+        plan_type TEXT,
+        phone_number TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS grant_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        payment_reference TEXT UNIQUE,
+        user_id INTEGER,
+        plan_type TEXT,
+        phone_number TEXT,
+        invite_link TEXT,
+        status TEXT,
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at TEXT,
+        last_error TEXT,
+        created_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_grant_outbox_pending ON grant_outbox (status, next_attempt_at)",
+)
+
+POSTGRES_SCHEMA = """
+CREATE SCHEMA IF NOT EXISTS {schema};
+CREATE TABLE IF NOT EXISTS {schema}.payments (
+    reference TEXT PRIMARY KEY,
+    user_id BIGINT,
+    amount INTEGER,
+    currency TEXT,
+    status TEXT,
+    created_at TEXT,
+    plan_type TEXT,
+    phone_number TEXT
+);
+CREATE TABLE IF NOT EXISTS {schema}.grant_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    payment_reference TEXT UNIQUE,
+    user_id BIGINT,
+    plan_type TEXT,
+    phone_number TEXT,
+    invite_link TEXT,
+    status TEXT,
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TEXT,
+    last_error TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_grant_outbox_pending ON {schema}.grant_outbox (status, next_attempt_at);
+"""
+
+class PaymentStore(abc.ABC):
+    """Payments and the grant outbox; timestamps are naive ISO strings, as elsewhere in the bot"""
+
+    # SQLite files to include in backups
+    files = ()
+
+    @abc.abstractmethod
+    async def open(self):
+        ...
+
+    @abc.abstractmethod
+    async def close(self):
+        ...
+
+    @abc.abstractmethod
+    async def record_pending(self, payment: tuple):
+        """Insert or replace a payments row (reference, user_id, amount, currency, status, created_at, plan_type, phone)"""
+
+    @abc.abstractmethod
+    async def record_success(self, reference: str, user_id: int, plan_type: str, phone, now: str) -> bool:
+        """Mark the payment successful and queue its grant in one transaction; True if newly queued"""
+
+    @abc.abstractmethod
+    async def find_payment(self, reference: str):
+        """(user_id, plan_type, phone_number, amount, currency) or None"""
+
+    @abc.abstractmethod
+    async def due_grants(self, now: str, limit: int) -> list:
+        """Pending outbox entries due by `now`, as dicts; pass them back unchanged"""
+
+    @abc.abstractmethod
+    async def finish_grants(self, results: list):
+        """Record (status, next_attempt_at, error, entry) outcomes from a dispatch batch"""
+
+    @abc.abstractmethod
+    async def save_grant_links(self, entry: dict, links: str):
+        ...
+
+    @abc.abstractmethod
+    async def pending_grants(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def import_rows(self, table: str, rows: list) -> int:
+        """Copy rows (dicts) of a store table from another backend, keeping existing ones; returns rows added"""
+
+    @abc.abstractmethod
+    async def archive(self, cutoff: datetime, batch_size: int, archive_dir: str) -> dict:
+        """Move old store rows into the archive; returns rows archived per table"""
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        ...
+
+class SQLiteShard:
+    """One database file written only by its writer task"""
+
+    def __init__(self, path: str, wal: bool):
+        self.path = path
+        self.wal = wal
+        self.writer_db = None
+        self.reader_db = None
+        self.queue = None
+        self.writer = None
+        self.batches = 0
+        self.writes = 0
+
+    async def open(self):
+        self.writer_db = await aiosqlite.connect(self.path)
+        # WAL lets reads run while the writer holds its transaction open
+        if self.wal:
+            await self.writer_db.execute("PRAGMA journal_mode = WAL")
+            await self.writer_db.execute("PRAGMA synchronous = NORMAL")
+        for statement in SQLITE_SCHEMA:
+            await self.writer_db.execute(statement)
+        await self.writer_db.commit()
+        self.reader_db = await aiosqlite.connect(self.path)
+        self.reader_db.row_factory = aiosqlite.Row
+        self.queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self.run_writer())
+
+    async def close(self):
+        if self.writer:
+            self.queue.put_nowait(None)
+            await self.writer
+            self.writer = None
+        for db in (self.reader_db, self.writer_db):
+            if db:
+                await db.close()
+        self.reader_db = self.writer_db = None
+
+    async def write(self, operation):
+        """Queue `await operation(db)` and return its result once its transaction has committed"""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((operation, future))
+        return await future
+
+    async def run_writer(self):
+        db = self.writer_db
+        stopping = False
+        while not stopping:
+            batch = [await self.queue.get()]
+            while len(batch) < STORAGE_WRITE_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if not batch:
+                continue
+
+            outcomes = []
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                for operation, future in batch:
+                    # A failing write rolls back alone; the rest of the batch still commits
+                    await db.execute("SAVEPOINT write")
+                    try:
+                        outcomes.append((future, await operation(db), None))
+                        await db.execute("RELEASE write")
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO write")
+                        await db.execute("RELEASE write")
+                        outcomes.append((future, None, e))
+                await db.commit()
+            except Exception as e:
+                if db.in_transaction:
+                    await db.rollback()
+                outcomes = [(future, None, e) for _, future in batch]
+
+            self.batches += 1
+            self.writes += len(batch)
+            for future, result, error in outcomes:
+                if future.done():
+                    continue
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+class SQLiteStore(PaymentStore):
+    def __init__(self, paths: list, wal: bool = False):
+        self.shards = [SQLiteShard(path, wal) for path in paths]
+        self.files = tuple(paths)
+
+    def shard_for(self, user_id: int) -> int:
+        if len(self.shards) == 1:
+            return 0
+        return zlib.crc32(str(user_id).encode()) % len(self.shards)
+
+    async def open(self):
+        for shard in self.shards:
+            await shard.open()
+
+    async def close(self):
+        for shard in self.shards:
+            await shard.close()
+
+    async def record_pending(self, payment: tuple):
+        async def write(db):
+            await db.execute(
+                """INSERT OR REPLACE INTO payments
+                (reference, user_id, amount, currency, status, created_at, plan_type, phone_number)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                payment
+            )
+        await self.shards[self.shard_for(payment[1])].write(write)
+
+    async def record_success(self, reference: str, user_id: int, plan_type: str, phone, now: str) -> bool:
+        async def write(db):
+            await db.execute("UPDATE payments SET status = 'success' WHERE reference = ?", (reference,))
+            # A payment is granted once, however many times it is confirmed
+            cursor = await db.execute(
+                """INSERT OR IGNORE INTO grant_outbox
+                (payment_reference, user_id, plan_type, phone_number, status, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)""",
+                (reference, user_id, plan_type, phone, now, now)
+            )
+            return cursor.rowcount > 0
+        return await self.shards[self.shard_for(user_id)].write(write)
+
+    async def find_payment(self, reference: str):
+        async def lookup(shard):
+            cursor = await shard.reader_db.execute(
+                "SELECT user_id, plan_type, phone_number, amount, currency FROM payments WHERE reference = ?",
+                (reference,)
+            )
+            return await cursor.fetchone()
+
+        # Paystack only sends the reference, so every shard is asked
+        rows = await asyncio.gather(*(lookup(shard) for shard in self.shards))
+        return next((tuple(row) for row in rows if row), None)
+
+    async def due_grants(self, now: str, limit: int) -> list:
+        entries = []
+        for index, shard in enumerate(self.shards):
+            cursor = await shard.reader_db.execute(
+                """SELECT * FROM grant_outbox WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?""",
+                (now, limit)
+            )
+            entries.extend(dict(row, shard=index) for row in await cursor.fetchall())
+        # Oldest first across shards; the rest are picked up by the next pass
+        entries.sort(key=lambda entry: entry["created_at"] or "")
+        return entries[:limit]
+
+    async def finish_grants(self, results: list):
+        by_shard = {}
+        for status, next_attempt_at, error, entry in results:
+            by_shard.setdefault(entry["shard"], []).append((status, next_attempt_at, error, error, entry["id"]))
+
+        def update(rows):
+            async def write(db):
+                await db.executemany(
+                    """UPDATE grant_outbox SET status = ?, next_attempt_at = ?, last_error = ?,
+                    attempts = attempts + (? IS NOT NULL) WHERE id = ?""",
+                    rows
+                )
+            return write
+
+        await asyncio.gather(*(self.shards[index].write(update(rows)) for index, rows in by_shard.items()))
+
+    async def save_grant_links(self, entry: dict, links: str):
+        async def write(db):
+            await db.execute("UPDATE grant_outbox SET invite_link = ? WHERE id = ?", (links, entry["id"]))
+        await self.shards[entry["shard"]].write(write)
+
+    async def pending_grants(self) -> int:
+        total = 0
+        for shard in self.shards:
+            cursor = await shard.reader_db.execute("SELECT COUNT(*) FROM grant_outbox WHERE status = 'pending'")
+            total += (await cursor.fetchone())[0]
+        return total
+
+    async def import_rows(self, table: str, rows: list) -> int:
+        columns = STORE_COLUMNS[table]
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(self.shard_for(row["user_id"]), []).append(tuple(row[column] for column in columns))
+
+        def insert(values):
+            async def write(db):
+                added = 0
+                for row in values:
+                    cursor = await db.execute(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                        row
+                    )
+                    added += cursor.rowcount
+                return added
+            return write
+
+        return sum(await asyncio.gather(*(self.shards[index].write(insert(values)) for index, values in by_shard.items())))
+
+    async def archive(self, cutoff: datetime, batch_size: int, archive_dir: str) -> dict:
+        archived = dict.fromkeys(STORE_TABLES, 0)
+        for shard in self.shards:
+            async with aiosqlite.connect(shard.path) as db:
+                for table in STORE_TABLES:
+                    archived[table] += await archive_table(db, table, cutoff, batch_size, archive_dir)
+        return archived
+
+    def stats(self) -> dict:
+        batches = sum(shard.batches for shard in self.shards)
+        writes = sum(shard.writes for shard in self.shards)
+        return {
+            "backend": "sqlite",
+            "shards": len(self.shards),
+            "queued": sum(shard.queue.qsize() for shard in self.shards if shard.queue),
+            "writes": writes,
+            "writes_per_commit": round(writes / batches, 2) if batches else 0,
+        }
+
+class PostgresStore(PaymentStore):
+    def __init__(self, dsn: str, schema: str = "public", pool_size: int = POSTGRES_POOL_SIZE):
+        self.dsn = dsn
+        self.schema = schema
+        self.pool_size = pool_size
+        self.pool = None
+
+    async def open(self):
+        try:
+            import asyncpg
+        except ImportError:
+            raise Exception("STORAGE_BACKEND=postgres needs asyncpg: pip install asyncpg")
+        if not self.dsn:
+            raise Exception("STORAGE_BACKEND=postgres needs DATABASE_URL")
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size)
+        async with self.pool.acquire() as conn:
+            await conn.execute(POSTGRES_SCHEMA.format(schema=self.schema))
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def record_pending(self, payment: tuple):
+        await self.pool.execute(
+            f"""INSERT INTO {self.schema}.payments
+            (reference, user_id, amount, currency, status, created_at, plan_type, phone_number)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            ON CONFLICT (reference) DO UPDATE SET user_id = excluded.user_id, amount = excluded.amount,
+                currency = excluded.currency, status = excluded.status, created_at = excluded.created_at,
+                plan_type = excluded.plan_type, phone_number = excluded.phone_number""",
+            *payment
+        )
+
+    async def record_success(self, reference: str, user_id: int, plan_type: str, phone, now: str) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    f"UPDATE {self.schema}.payments SET status = 'success' WHERE reference = $1", reference
+                )
+                status = await conn.execute(
+                    f"""INSERT INTO {self.schema}.grant_outbox
+                    (payment_reference, user_id, plan_type, phone_number, status, attempts, next_attempt_at, created_at)
+                    VALUES ($1, $2, $3, $4, 'pending', 0, $5, $5)
+                    ON CONFLICT (payment_reference) DO NOTHING""",
+                    reference, user_id, plan_type, phone, now
+                )
+        # Command tag "INSERT 0 <rows>"
+        return status.split()[-1] != "0"
+
+    async def find_payment(self, reference: str):
+        row = await self.pool.fetchrow(
+            f"""SELECT user_id, plan_type, phone_number, amount, currency FROM {self.schema}.payments
+            WHERE reference = $1""",
+            reference
+        )
+        return tuple(row) if row else None
+
+    async def due_grants(self, now: str, limit: int) -> list:
+        rows = await self.pool.fetch(
+            f"""SELECT * FROM {self.schema}.grant_outbox WHERE status = 'pending' AND next_attempt_at <= $1
+            ORDER BY id LIMIT $2""",
+            now, limit
+        )
+        return [dict(row) for row in rows]
+
+    async def finish_grants(self, results: list):
+        await self.pool.executemany(
+            f"""UPDATE {self.schema}.grant_outbox SET status = $1, next_attempt_at = $2, last_error = $3,
+            attempts = attempts + ($3::text IS NOT NULL)::int WHERE id = $4""",
+            [(status, next_attempt_at, error, entry["id"]) for status, next_attempt_at, error, entry in results]
+        )
+
+    async def save_grant_links(self, entry: dict, links: str):
+        await self.pool.execute(f"UPDATE {self.schema}.grant_outbox SET invite_link = $1 WHERE id = $2", links, entry["id"])
+
+    async def pending_grants(self) -> int:
+        return await self.pool.fetchval(f"SELECT COUNT(*) FROM {self.schema}.grant_outbox WHERE status = 'pending'")
+
+    async def import_rows(self, table: str, rows: list) -> int:
+        columns = STORE_COLUMNS[table]
+        added = 0
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for row in rows:
+                    status = await conn.execute(
+                        f"INSERT INTO {self.schema}.{table} ({', '.join(columns)}) "
+                        f"VALUES ({', '.join(f'${index}' for index in range(1, len(columns) + 1))}) "
+                        f"ON CONFLICT DO NOTHING",
+                        *(row[column] for column in columns)
+                    )
+                    added += int(status.split()[-1])
+        return added
+
+    async def archive(self, cutoff: datetime, batch_size: int, archive_dir: str) -> dict:
+        archived = dict.fromkeys(STORE_TABLES, 0)
+        stale = (cutoff - timedelta(days=30)).isoformat()
+        for table in STORE_TABLES:
+            timestamp_column, condition, key_columns = ARCHIVE_TABLES[table]
+            key = key_columns[0]
+            # Postgres rejects parameters the query never uses
+            params = (cutoff.isoformat(), stale) if ":stale" in condition else (cutoff.isoformat(),)
+            while True:
+                rows = [dict(row) for row in await self.pool.fetch(
+                    f"SELECT * FROM {self.schema}.{table} "
+                    f"WHERE {timestamp_column} < $1 AND ({condition.replace(':stale', '$2')}) LIMIT {batch_size}",
+                    *params
+                )]
+                if not rows:
+                    break
+                await asyncio.to_thread(append_rows, table, rows, timestamp_column, archive_dir)
+                # Re-check the condition so a row updated since the SELECT is kept
+                await self.pool.execute(
+                    f"DELETE FROM {self.schema}.{table} WHERE {key} = ANY($1) "
+                    f"AND {timestamp_column} < $2 AND ({condition.replace(':stale', '$3')})",
+                    [row[key] for row in rows], *params
+                )
+                archived[table] += len(rows)
+        return archived
+
+    def stats(self) -> dict:
+        return {
+            "backend": "postgres",
+            "schema": self.schema,
+            "pool_size": self.pool.get_size() if self.pool else 0,
+            "pool_idle": self.pool.get_idle_size() if self.pool else 0,
+        }
+
+def create_store(database: str, namespace: str = "default") -> PaymentStore:
+    """Store for a bot whose own database is `database`, configured by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStore([database], wal=True)
+    if STORAGE_BACKEND == "sqlite-sharded":
+        stem = os.path.splitext(database)[0]
+        return SQLiteStore([f"{stem}.shard{index}.db" for index in range(STORAGE_SHARDS)], wal=True)
+    if STORAGE_BACKEND == "postgres":
+        schema = "public" if namespace == "default" else f"bot_{namespace.replace('-', '_')}"
+        return PostgresStore(DATABASE_URL, schema)
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
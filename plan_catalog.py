@@ -0,0 +1,122 @@
+"""
+Subscription plan catalog
+Plans live in the `plans` table. Each load builds an immutable snapshot with
+every plan-dependent text and keyboard rendered up front; the bot swaps the
+whole snapshot in one assignment, so handlers never see a half-updated catalog
+and do no per-request formatting of plan details.
+"""
+
+import json
+from types import MappingProxyType
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+PLAN_COLUMNS = ("plan_type", "label", "region", "emoji", "method", "currency", "amount", "hours",
+                "requires_phone", "sort_order", "active", "channels")
+
+PHONE_FORMATS_TEXT = (
+    "✅ Accepted formats:\n"
+    "• 07XXXXXXXX\n"
+    "• 7XXXXXXXX\n"
+    "• 2547XXXXXXXX\n"
+    "• 2541XXXXXXXX\n"
+    "• +2547XXXXXXXX\n\n"
+)
+
+def price_label(plan: dict) -> str:
+    if plan["currency"] == "USD":
+        return f"${plan['amount']}"
+    return f"{plan['currency']} {plan['amount']}"
+
+def parse_channels(value) -> tuple:
+    """Channel ids from the comma-separated `channels` column (or a JSON list)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(str(channel) for channel in value)
+    return tuple(channel.strip() for channel in (value or "").split(",") if channel.strip())
+
+def bundle_suffix(plan) -> str:
+    return f" · {len(plan['channels'])} channels" if len(plan["channels"]) > 1 else ""
+
+class PlanCatalog:
+    """Read-only snapshot of the plans plus their prerendered texts"""
+
+    __slots__ = ("plans", "offered", "channels", "start_text", "subscribe_text", "subscribe_markup",
+                 "selected_text", "payment_ready_text", "amount_text")
+
+    def __init__(self, rows: list):
+        plans = {}
+        for row in rows:
+            plan = dict(zip(PLAN_COLUMNS, row)) if not isinstance(row, dict) else dict(row)
+            plan["requires_phone"] = bool(plan["requires_phone"])
+            plan["active"] = bool(plan["active"])
+            plan["channels"] = parse_channels(plan["channels"])
+            if plan["active"] and not plan["channels"]:
+                raise ValueError(f"Plan {plan['plan_type']} has no channels")
+            plans[plan["plan_type"]] = MappingProxyType(plan)
+
+        # Inactive plans stay resolvable so already-paid grants still complete
+        self.plans = MappingProxyType(plans)
+        offered = sorted((p for p in plans.values() if p["active"]), key=lambda p: p["sort_order"])
+        self.offered = tuple(p["plan_type"] for p in offered)
+        # Every channel any plan grants, including retired ones, so leaves are still tracked
+        self.channels = frozenset(channel for p in plans.values() for channel in p["channels"])
+
+        hours = {p["hours"] for p in offered}
+        access = f"{hours.pop()} hours" if len(hours) == 1 else "timed"
+        channel_noun = "channels" if any(len(p["channels"]) > 1 for p in offered) else "channel"
+
+        self.start_text = (
+            f"Get {access} access to our exclusive private {channel_noun}.\n\n"
+            "💰 Payment Options:\n"
+            + "".join(f"• {p['emoji']} {p['region']}: {price_label(p)} via {p['method']}{bundle_suffix(p)}\n"
+                      for p in offered)
+            + "\nUse /subscribe to get access"
+        )
+        self.subscribe_text = f"Choose your payment method ({access} access):"
+        self.subscribe_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"{p['emoji']} {p['region']} - {price_label(p)} ({p['method']}){bundle_suffix(p)}",
+                                  callback_data=f"plan_{p['plan_type']}")]
+            for p in offered
+        ])
+
+        self.selected_text = MappingProxyType({
+            p["plan_type"]: (
+                f"{p['emoji']} {p['region']} Plan Selected\n\n"
+                f"💰 Amount: {price_label(p)}\n"
+                f"⏰ Access: {p['hours']} hours\n"
+                f"📱 Payment: {p['method']}\n\n"
+                "Please send your mobile money number:\n\n"
+                + PHONE_FORMATS_TEXT
+                + "Works with all providers: M-Pesa, Airtel Money, Telkom Cash"
+            )
+            for p in plans.values() if p["requires_phone"]
+        })
+        self.payment_ready_text = MappingProxyType({
+            p["plan_type"]: (
+                f"✅ Payment Ready!\n\n"
+                f"Plan: {p['label']}\n"
+                f"Amount: {p['amount']} {p['currency']}\n"
+                f"Access: {p['hours']} hours\n\n"
+                "Click 'Pay Now' to complete payment securely within Telegram.\n"
+                "After payment, click 'I've Paid' to verify."
+            )
+            for p in plans.values()
+        })
+        # Amount/access lines shown under the user's phone number
+        self.amount_text = MappingProxyType({
+            p["plan_type"]: f"💰 Amount: {price_label(p)}\n⏰ Access: {p['hours']} hours\n\n"
+            for p in plans.values()
+        })
+
+PLAN_DEFAULTS = {"emoji": "", "method": "Card", "requires_phone": False, "sort_order": 0, "active": True}
+
+def load_plans_file(path: str) -> list:
+    """Read plan rows from a JSON file: a list of objects with PLAN_COLUMNS keys"""
+    with open(path, "r", encoding="utf-8") as f:
+        plans = json.load(f)
+    rows = []
+    for plan in plans:
+        plan = {**PLAN_DEFAULTS, "region": plan.get("label"), **plan}
+        plan["channels"] = ",".join(parse_channels(plan.get("channels")))
+        rows.append(tuple(plan[column] for column in PLAN_COLUMNS))
+    return rows
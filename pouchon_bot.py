@@ -1,18 +1,123 @@
 import os
 import logging
+import logging.handlers
 import asyncio
+import atexit
+import queue
+import random
 import re
-from fastapi import FastAPI, Request
-from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+import threading
+import time
+import uuid
+import hmac
+import hashlib
+import orjson
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import ChatMember, ChatMemberUpdated, LabeledPrice
+from telegram.ext import (
+    Application, CommandHandler, ContextTypes, CallbackQueryHandler, ChatMemberHandler, MessageHandler,
+    PreCheckoutQueryHandler, filters
+)
 from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
 import uvicorn
 import aiosqlite
 import httpx
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+from urllib.parse import parse_qs
+from timing_wheel import TimingWheel
+from clock import SystemClock
+from subscription_archive import ARCHIVE_DIR, ARCHIVE_TABLES, archive_table
+from db_backup import create_backup, prune_backups
+from traffic_replay import TrafficRecorder
+from sampling_profiler import MemoryProfiler, collapsed, sample_cpu
+from loop_watchdog import LoopWatchdog
+from velocity_guard import VelocityGuard
+from event_bus import EventBus
+from payment_store import SQLITE_SCHEMA, STORE_TABLES, create_store
+from plan_catalog import PHONE_FORMATS_TEXT, PLAN_COLUMNS, PlanCatalog, load_plans_file
 
-logging.basicConfig(level=logging.INFO)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+# Loggers that emit an INFO line per request; only a sample of those is kept
+HIGH_VOLUME_LOGGERS = ("httpx", "uvicorn.access")
+
+# Telegram update_id of the update being handled, attached to every log line
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+class CorrelationFilter(logging.Filter):
+    """Capture the correlation id on the event loop before the record is queued"""
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO lines from high-volume loggers or logged with extra={"sampled": True}"""
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record):
+        if record.levelno != logging.INFO:
+            return True
+        if record.name.startswith(HIGH_VOLUME_LOGGERS) or getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed via extra= are included"""
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "correlation_id", "sampled"}
+    
+    def format(self, record):
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "correlation_id", None) is not None:
+            entry["correlation_id"] = record.correlation_id
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        return orjson.dumps(entry, default=str).decode()
+
+class AccessLogFilter(logging.Filter):
+    """Drop query strings from uvicorn access lines so secrets passed in URLs never reach the logs"""
+    def filter(self, record):
+        if record.name == "uvicorn.access" and isinstance(record.args, tuple) and len(record.args) == 5:
+            client, method, path, http_version, status = record.args
+            record.args = (client, method, path.partition("?")[0], http_version, status)
+        return True
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route all logging through a queue so formatting and stdout writes happen off the event loop"""
+    log_queue = queue.SimpleQueue()
+    
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    queue_handler.addFilter(CorrelationFilter())
+    queue_handler.addFilter(AccessLogFilter())
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+    
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Pouchon Premium Bot")
@@ -20,26 +125,231 @@ bot_app = None
 
 PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Channel granted by the seeded plans; plans list their own channels in the plans table
 PRIVATE_CHANNEL_ID = os.getenv("PRIVATE_CHANNEL_ID", "-1003139716802")
+# Overridable so a local instance can run against the stubs in traffic_replay.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+PAYSTACK_API_URL = os.getenv("PAYSTACK_API_URL", "https://api.paystack.co")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+# "stk" pushes the M-Pesa prompt straight to the phone; "checkout" sends a Paystack payment page
+KENYA_PAYMENT_MODE = os.getenv("KENYA_PAYMENT_MODE", "stk")
+MPESA_PROVIDER = os.getenv("MPESA_PROVIDER", "mpesa")
+# When set, the international plan is paid with a native Telegram invoice instead of Paystack checkout
+TELEGRAM_PAYMENT_PROVIDER_TOKEN = os.getenv("TELEGRAM_PAYMENT_PROVIDER_TOKEN")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+# Telegram allows 1-100 concurrent webhook connections
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", min(40 * WEB_CONCURRENCY, 100)))
+# Queued updates include successful_payment confirmations, so they are kept by default
+WEBHOOK_DROP_PENDING_UPDATES = os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "false").lower() == "true"
 
+# Update types our handlers consume; anything else is acknowledged without deserializing
+HANDLED_UPDATE_TYPES = ("message", "callback_query", "chat_member", "pre_checkout_query")
+
+# Seed rows for each bot's plans table; the live values come from its plan_catalog
 SUBSCRIPTION_PLANS = {
     "kenya": {
         "currency": "KES",
         "amount": 60,
         "hours": 12,
         "label": "Kenya (M-Pesa)",
-        "requires_phone": True
+        "requires_phone": True,
+        "region": "Kenya",
+        "emoji": "🇰🇪",
+        "method": "M-Pesa",
+        "sort_order": 1,
+        "active": True,
+        "channels": PRIVATE_CHANNEL_ID
     },
     "international": {
         "currency": "USD", 
         "amount": 20,
         "hours": 12,
         "label": "International",
-        "requires_phone": False
+        "requires_phone": False,
+        "region": "International",
+        "emoji": "🌍",
+        "method": "Card",
+        "sort_order": 2,
+        "active": True,
+        "channels": PRIVATE_CHANNEL_ID
     }
 }
 
-user_sessions = {}
+def seed_plans(channel_id: str) -> list:
+    """SUBSCRIPTION_PLANS as plan rows granting `channel_id`"""
+    return [dict(plan, plan_type=plan_type, channels=channel_id) for plan_type, plan in SUBSCRIPTION_PLANS.items()]
+
+# Optional JSON file of plans, synced into the table whenever it changes
+PLANS_FILE = os.getenv("PLANS_FILE")
+PLANS_FILE_POLL_SECONDS = float(os.getenv("PLANS_FILE_POLL_SECONDS", "30"))
+# Telegram user ids allowed to run admin commands
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+# Bots served by this process. The env-configured bot is "default" and keeps subscriptions.db and
+# /telegram_webhook; BOTS_FILE (a JSON list) adds bots with their own token, database, plans,
+# channel and Paystack keys at /telegram_webhook/<key>. "env:NAME" values are read from the environment.
+BOTS_FILE = os.getenv("BOTS_FILE")
+DEFAULT_BOT_KEY = "default"
+# Bot API connections shared by every hosted bot
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "256"))
+
+class BotTenant:
+    """One hosted bot with its per-bot state; everything else in the process is shared"""
+
+    def __init__(self, key: str, token: str, paystack_secret_key: str = None, webhook_secret_token: str = None,
+                 channel_id: str = PRIVATE_CHANNEL_ID, payment_provider_token: str = None, plans_file: str = None):
+        self.key = key
+        self.token = token
+        self.paystack_secret_key = paystack_secret_key
+        self.webhook_secret_token = webhook_secret_token
+        self.channel_id = str(channel_id)
+        self.payment_provider_token = payment_provider_token
+        self.plans_file = plans_file
+        hosted = key != DEFAULT_BOT_KEY
+        self.database = f"subscriptions_{key}.db" if hosted else "subscriptions.db"
+        self.archive_dir = os.path.join(ARCHIVE_DIR, "bots", key) if hosted else ARCHIVE_DIR
+        self.webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{key}" if WEBHOOK_URL and hosted else WEBHOOK_URL
+        # Payments and the grant outbox; see payment_store.py for the backends
+        self.store = create_store(self.database, key)
+        self.application = None
+        self.plan_catalog = PlanCatalog(seed_plans(self.channel_id))
+        self.user_sessions = {}
+        # Webhook updates being processed; each bot has its own WEBHOOK_MAX_CONNECTIONS from Telegram
+        self.inflight_updates = 0
+        # (user_id, channel_id) -> whether the user is currently in that channel, kept current from chat_member updates
+        self.channel_membership = {}
+
+def load_bots() -> dict:
+    bots = {DEFAULT_BOT_KEY: BotTenant(DEFAULT_BOT_KEY, BOT_TOKEN, PAYSTACK_SECRET_KEY, WEBHOOK_SECRET_TOKEN,
+                                       PRIVATE_CHANNEL_ID, TELEGRAM_PAYMENT_PROVIDER_TOKEN, PLANS_FILE)}
+    if not BOTS_FILE:
+        return bots
+    
+    with open(BOTS_FILE, "rb") as f:
+        configs = orjson.loads(f.read())
+    for config in configs:
+        config = {
+            name: os.getenv(value[4:]) if isinstance(value, str) and value.startswith("env:") else value
+            for name, value in config.items()
+        }
+        key = config.pop("key", "")
+        if not re.fullmatch(r"[a-z0-9_-]+", key) or key in bots:
+            raise ValueError(f"Invalid or duplicate bot key in {BOTS_FILE}: {key!r}")
+        bots[key] = BotTenant(key, **config)
+    return bots
+
+bots = load_bots()
+default_bot = bots[DEFAULT_BOT_KEY]
+# Bot whose update, webhook or background batch is being handled
+current_bot = contextvars.ContextVar("current_bot", default=default_bot)
+
+def active_bot() -> BotTenant:
+    return current_bot.get()
+
+@contextmanager
+def bot_context(tenant: BotTenant):
+    token = current_bot.set(tenant)
+    try:
+        yield tenant
+    finally:
+        current_bot.reset(token)
+
+def running_bots() -> list:
+    return [tenant for tenant in bots.values() if tenant.application]
+
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "5"))
+EXPIRY_REMINDER_MINUTES = int(os.getenv("EXPIRY_REMINDER_MINUTES", "60"))
+# Telegram allows ~30 messages/second to different users
+OUTBOUND_BATCH_SIZE = int(os.getenv("OUTBOUND_BATCH_SIZE", "25"))
+
+# Every time-based decision reads this; simulate_subscriptions.py swaps in a VirtualClock
+clock = SystemClock()
+expiry_wheel = TimingWheel(tick=SCHEDULER_TICK_SECONDS, start=clock.time())
+
+def use_clock(new_clock):
+    """Swap the time source; the expiry wheel restarts at the new time, so call this before scheduling"""
+    global clock, expiry_wheel
+    clock = new_clock
+    expiry_wheel = TimingWheel(tick=SCHEDULER_TICK_SECONDS, start=clock.time())
+
+GRANT_BATCH_SIZE = int(os.getenv("GRANT_BATCH_SIZE", "20"))
+GRANT_MAX_ATTEMPTS = int(os.getenv("GRANT_MAX_ATTEMPTS", "5"))
+GRANT_RETRY_BASE_SECONDS = float(os.getenv("GRANT_RETRY_BASE_SECONDS", "5"))
+GRANT_POLL_SECONDS = float(os.getenv("GRANT_POLL_SECONDS", "10"))
+# Invite links created at once for one bundle grant
+INVITE_LINK_CONCURRENCY = int(os.getenv("INVITE_LINK_CONCURRENCY", "5"))
+
+# Auto-renew charges saved cards this long before expiry, in batched runs
+RENEWAL_LEAD_MINUTES = int(os.getenv("RENEWAL_LEAD_MINUTES", "120"))
+RENEWAL_INTERVAL_MINUTES = float(os.getenv("RENEWAL_INTERVAL_MINUTES", "15"))
+RENEWAL_BATCH_SIZE = int(os.getenv("RENEWAL_BATCH_SIZE", "50"))
+RENEWAL_CONCURRENCY = int(os.getenv("RENEWAL_CONCURRENCY", "5"))
+# Auto-renew is switched off after this many consecutive declined renewals
+RENEWAL_MAX_FAILURES = int(os.getenv("RENEWAL_MAX_FAILURES", "2"))
+
+# Set whenever a grant is queued so the dispatcher wakes without waiting for its poll;
+# created on startup so it binds to uvicorn's event loop
+grant_outbox_event = None
+
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "200"))
+
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+
+SHUTDOWN_DEADLINE_SECONDS = float(os.getenv("SHUTDOWN_DEADLINE_SECONDS", "20"))
+
+# Above either limit new subscribe flows get SHED_REPLY; payment checks and grants are always served
+SHED_PAYSTACK_INFLIGHT = int(os.getenv("SHED_PAYSTACK_INFLIGHT", "20"))
+# Telegram never has more than WEBHOOK_MAX_CONNECTIONS updates in flight per bot, so shed below that
+SHED_INFLIGHT_UPDATES = int(os.getenv("SHED_INFLIGHT_UPDATES", max(WEBHOOK_MAX_CONNECTIONS * 3 // 4, 1)))
+SHED_REPLY = "⏳ High demand right now. Please try again in a minute."
+paystack_inflight = 0
+shed_count = 0
+
+# Payment velocity rules are checked in memory on every payment creation (see velocity_guard.py)
+VELOCITY_PERSIST_SECONDS = float(os.getenv("VELOCITY_PERSIST_SECONDS", "60"))
+VELOCITY_REPLY = "⚠️ Too many payment attempts. Please try again later or contact admin."
+velocity_guard = VelocityGuard()
+
+# Live events for /admin/events; slow viewers lose their oldest frames past the buffer size
+DASHBOARD_BUFFER_SIZE = int(os.getenv("DASHBOARD_BUFFER_SIZE", "256"))
+DASHBOARD_KEEPALIVE_SECONDS = 15
+# The dashboard signs in once with the admin token and then rides a short-lived HttpOnly cookie
+DASHBOARD_SESSION_SECONDS = int(os.getenv("DASHBOARD_SESSION_SECONDS", "43200"))
+DASHBOARD_COOKIE = "pouchon_dashboard"
+event_bus = EventBus(buffer_size=DASHBOARD_BUFFER_SIZE)
+
+# Bearer token for the /admin endpoints; they are disabled when unset
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+PROFILE_MAX_SECONDS = 60
+
+cpu_profile_lock = asyncio.Lock()
+memory_profiler = MemoryProfiler()
+
+# Any callback or stall longer than this is logged with the blocking stack
+SLOW_CALLBACK_SECONDS = float(os.getenv("SLOW_CALLBACK_SECONDS", "0.25"))
+# LoopWatchdog does slow-callback detection in production; asyncio's own slow-callback
+# report (at the same threshold) only exists in debug mode, which adds overhead to every task
+ASYNCIO_DEBUG = os.getenv("ASYNCIO_DEBUG", "false").lower() == "true"
+loop_watchdog = LoopWatchdog(threshold=SLOW_CALLBACK_SECONDS)
+
+# Optional anonymized recording of webhook traffic for replay (see traffic_replay.py)
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+traffic_recorder = None
+if TRAFFIC_RECORD_PATH:
+    traffic_recorder = TrafficRecorder(TRAFFIC_RECORD_PATH, os.getenv("TRAFFIC_RECORD_SALT", BOT_TOKEN or ""))
+
+# Shared connection pool for Paystack calls
+http_client = None
+
+# Long-running loops started on startup and drained on shutdown
+background_tasks = []
+shutdown_event = None
+# Set in __main__; open dashboard streams close once it starts exiting so they never hold up a deploy
+uvicorn_server = None
 
 class UserSession:
     def __init__(self, user_id: int):
@@ -88,72 +398,343 @@ def format_phone_for_paystack(phone: str) -> str:
     # Return original if no match
     return cleaned_phone
 
+def build_application(tenant: BotTenant, request: HTTPXRequest) -> Application:
+    application = Application.builder().token(tenant.token).base_url(TELEGRAM_API_URL).request(request).build()
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("autorenew", autorenew_command))
+    application.add_handler(CommandHandler("reloadplans", reload_plans_command))
+    application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(ChatMemberHandler(chat_member_handler, ChatMemberHandler.CHAT_MEMBER))
+    application.add_handler(PreCheckoutQueryHandler(precheckout_handler))
+    application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment_handler))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+async def start_bot(tenant: BotTenant, request: HTTPXRequest):
+    """Initialize one bot, its database and its timers; runs inside bot_context(tenant)"""
+    tenant.application = build_application(tenant, request)
+    try:
+        await tenant.application.initialize()
+        await init_db()
+        await tenant.store.open()
+        await load_plan_catalog()
+        await register_webhook()
+        await rehydrate_expiry_schedule()
+    except Exception:
+        tenant.application = None
+        await tenant.store.close()
+        raise
+    logger.info(f"Bot connected: @{tenant.application.bot.username}", extra={"bot": tenant.key})
+
 @app.on_event("startup")
 async def startup_event():
     global bot_app
     try:
-        if not BOT_TOKEN:
+        if not any(tenant.token for tenant in bots.values()):
             logger.error("BOT_TOKEN not set!")
             return
         
-        bot_app = Application.builder().token(BOT_TOKEN).build()
-        bot_app.add_handler(CommandHandler("start", start_command))
-        bot_app.add_handler(CommandHandler("help", help_command))
-        bot_app.add_handler(CommandHandler("subscribe", subscribe_command))
-        bot_app.add_handler(CommandHandler("status", status_command))
-        bot_app.add_handler(CallbackQueryHandler(button_handler))
-        bot_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        telegram_request = HTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE)
+        for tenant in bots.values():
+            if not tenant.token:
+                continue
+            with bot_context(tenant):
+                try:
+                    await start_bot(tenant, telegram_request)
+                except Exception as e:
+                    logger.error(f"Startup failed for bot {tenant.key}: {e}")
+        bot_app = default_bot.application
         
-        await bot_app.initialize()
-        await init_db()
+        # Fraud review and velocity state live in the default database even when its bot is off
+        if not bot_app:
+            await init_db()
+        await load_velocity_state()
+        
+        if traffic_recorder:
+            traffic_recorder.start()
         
-        bot_info = await bot_app.bot.get_me()
-        logger.info(f"Bot connected: @{bot_info.username}")
+        global grant_outbox_event, shutdown_event
+        grant_outbox_event = asyncio.Event()
+        shutdown_event = asyncio.Event()
+        
+        loop = asyncio.get_running_loop()
+        if ASYNCIO_DEBUG:
+            loop.slow_callback_duration = SLOW_CALLBACK_SECONDS
+            loop.set_debug(True)
+        background_tasks.append(asyncio.create_task(loop_watchdog.run(wait_for_shutdown)))
+        background_tasks.append(asyncio.create_task(run_expiry_scheduler()))
+        background_tasks.append(asyncio.create_task(run_grant_dispatcher()))
+        background_tasks.append(asyncio.create_task(run_archiver()))
+        background_tasks.append(asyncio.create_task(run_renewals()))
+        background_tasks.append(asyncio.create_task(run_velocity_persistence()))
+        if any(tenant.plans_file for tenant in bots.values()):
+            background_tasks.append(asyncio.create_task(watch_plans_file()))
+        if BACKUP_INTERVAL_HOURS > 0:
+            background_tasks.append(asyncio.create_task(run_backups()))
         
     except Exception as e:
         logger.error(f"Startup failed: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event_handler():
+    """Drain background loops within the deadline, then release resources"""
+    # uvicorn has already stopped accepting connections and waited for in-flight requests
+    # (timeout_graceful_shutdown) before lifespan shutdown runs, so no webhook update is mid-flight here
+    global http_client
+    deadline = time.monotonic() + SHUTDOWN_DEADLINE_SECONDS
+    stats = {}
+    
+    # Loops finish their current batch and exit; whatever overruns the deadline is cancelled
+    if shutdown_event:
+        shutdown_event.set()
+    if grant_outbox_event:
+        grant_outbox_event.set()
+    stats["tasks_drained"] = stats["tasks_cancelled"] = 0
+    if background_tasks:
+        done, pending = await asyncio.wait(background_tasks, timeout=max(deadline - time.monotonic(), 0))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        stats["tasks_drained"], stats["tasks_cancelled"] = len(done), len(pending)
+        background_tasks.clear()
+    
+    stats["grants_pending"] = 0
+    for tenant in running_bots():
+        try:
+            stats["grants_pending"] += await tenant.store.pending_grants()
+            await tenant.store.close()
+        except Exception as e:
+            logger.error(f"Shutdown outbox check failed: {e}", extra={"bot": tenant.key})
+    
+    if traffic_recorder:
+        traffic_recorder.stop()
+    if http_client:
+        await http_client.aclose()
+        http_client = None
+    # The bots share one connection pool; the first shutdown closes it and the rest are no-ops
+    for tenant in running_bots():
+        await tenant.application.shutdown()
+    
+    logger.info("Shutdown complete", extra=stats)
+
+@asynccontextmanager
+async def paystack_call():
+    """Count in-flight Paystack requests for admission control"""
+    global paystack_inflight
+    paystack_inflight += 1
+    try:
+        yield
+    finally:
+        paystack_inflight -= 1
+
+def admit_new_flow() -> bool:
+    """Whether a new subscribe flow may start; users who already paid never go through this"""
+    global shed_count
+    if paystack_inflight < SHED_PAYSTACK_INFLIGHT and active_bot().inflight_updates < SHED_INFLIGHT_UPDATES:
+        return True
+    shed_count += 1
+    return False
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient()
+    return http_client
+
+async def wait_for_shutdown(seconds: float) -> bool:
+    """Sleep for `seconds`, returning True early if shutdown has started"""
+    if shutdown_event is None:
+        await asyncio.sleep(seconds)
+        return False
+    try:
+        await asyncio.wait_for(shutdown_event.wait(), timeout=seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def register_webhook():
+    """Register the active bot's webhook with only the update types we handle"""
+    tenant = active_bot()
+    if not tenant.webhook_url:
+        logger.info("WEBHOOK_URL not set, skipping webhook registration")
+        return
+    
+    try:
+        await tenant.application.bot.set_webhook(
+            url=tenant.webhook_url,
+            allowed_updates=list(HANDLED_UPDATE_TYPES),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=WEBHOOK_DROP_PENDING_UPDATES,
+            secret_token=tenant.webhook_secret_token
+        )
+        logger.info(
+            f"Webhook registered: {tenant.webhook_url} "
+            f"(updates={','.join(HANDLED_UPDATE_TYPES)}, max_connections={WEBHOOK_MAX_CONNECTIONS}, "
+            f"drop_pending={WEBHOOK_DROP_PENDING_UPDATES})"
+        )
+    except Exception as e:
+        logger.error(f"Webhook registration failed: {e}")
+
+# subscriptions as written by the first version of the bot; migrate_legacy.py moves it aside
+LEGACY_SUBSCRIPTION_COLUMNS = {"user_id", "plan", "expires_at", "reference", "phone", "active"}
+
+def is_legacy_subscriptions(columns: set) -> bool:
+    """True for the legacy subscriptions shape, including copies a later column was added to"""
+    return LEGACY_SUBSCRIPTION_COLUMNS <= columns and "payment_reference" not in columns
+
+async def add_missing_columns(db, table: str, columns: dict):
+    """Add columns introduced after a table was first created"""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in await cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
 async def init_db():
+    """Create or upgrade the active bot's database"""
+    tenant = active_bot()
     try:
-        async with aiosqlite.connect("subscriptions.db") as db:
+        async with aiosqlite.connect(tenant.database) as db:
+            # Incremental vacuum lets the archiver return freed pages in small steps;
+            # switching an existing database needs one full VACUUM
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            if (await cursor.fetchone())[0] != 2:
+                await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await db.execute("VACUUM")
+            # WAL (persistent) keeps backups and long reads from blocking payment and grant commits
+            await db.execute("PRAGMA journal_mode = WAL")
+            
+            cursor = await db.execute("PRAGMA table_info(subscriptions)")
+            if is_legacy_subscriptions({row[1] for row in await cursor.fetchall()}):
+                # Left exactly as it is so migrate_legacy.py can recognise and move it aside
+                logger.error("subscriptions table is in the legacy shape; run migrate_legacy.py")
+            else:
+                await db.execute("""
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    user_id INTEGER PRIMARY KEY,
+                    plan_type TEXT,
+                    phone_number TEXT,
+                    payment_reference TEXT UNIQUE,
+                    amount INTEGER,
+                    currency TEXT,
+                    access_granted_at TEXT,
+                    expires_at TEXT,
+                    invite_link TEXT,
+                    active INTEGER DEFAULT 0,
+                    joined_at TEXT
+                )
+                """)
+                await add_missing_columns(db, "subscriptions", {"joined_at": "TEXT"})
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_expiry ON subscriptions (active, expires_at)")
+                # One row per channel of an active subscription; rows are deleted when access expires
+                cursor = await db.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'subscription_channels'"
+                )
+                migrate_channels = await cursor.fetchone() is None
+                await db.execute("""
+                CREATE TABLE IF NOT EXISTS subscription_channels (
+                    user_id INTEGER,
+                    channel_id TEXT,
+                    invite_link TEXT,
+                    joined_at TEXT,
+                    PRIMARY KEY (user_id, channel_id)
+                )
+                """)
+                if migrate_channels:
+                    await db.execute(
+                        """INSERT INTO subscription_channels (user_id, channel_id, invite_link, joined_at)
+                        SELECT user_id, ?, invite_link, joined_at FROM subscriptions WHERE active = 1""",
+                        (tenant.channel_id,)
+                    )
+                # Every payment reference already applied to a subscription, written with it, so a
+                # replayed outbox entry is recognised even after later grants for the same user
+                cursor = await db.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'applied_grants'"
+                )
+                migrate_applied = await cursor.fetchone() is None
+                await db.execute("""
+                CREATE TABLE IF NOT EXISTS applied_grants (
+                    payment_reference TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    applied_at TEXT
+                )
+                """)
+                if migrate_applied:
+                    await db.execute(
+                        """INSERT OR IGNORE INTO applied_grants (payment_reference, user_id, applied_at)
+                        SELECT payment_reference, user_id, access_granted_at FROM subscriptions
+                        WHERE payment_reference IS NOT NULL"""
+                    )
+            # payments and grant_outbox (the store's tables) are created here too, so
+            # databases written before the store keep working for migrations
+            for statement in SQLITE_SCHEMA:
+                await db.execute(statement)
+            await add_missing_columns(db, "payments", {"plan_type": "TEXT", "phone_number": "TEXT"})
             await db.execute("""
-            CREATE TABLE IF NOT EXISTS subscriptions (
+            CREATE TABLE IF NOT EXISTS fraud_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT,
+                rule TEXT,
+                subject TEXT,
+                user_id INTEGER,
+                count INTEGER,
+                action TEXT,
+                status TEXT DEFAULT 'open',
+                resolved_at TEXT,
+                bot_key TEXT
+            )
+            """)
+            await add_missing_columns(db, "fraud_events", {"bot_key": "TEXT"})
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_fraud_events_status ON fraud_events (status, id)")
+            await db.execute("CREATE TABLE IF NOT EXISTS fraud_blocklist (subject TEXT PRIMARY KEY, created_at TEXT)")
+            await db.execute("CREATE TABLE IF NOT EXISTS velocity_state (id INTEGER PRIMARY KEY, state TEXT, saved_at TEXT)")
+            # Reusable Paystack card authorizations; renewed_for holds the expiry last charged for
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS payment_authorizations (
                 user_id INTEGER PRIMARY KEY,
-                plan_type TEXT,
-                phone_number TEXT,
-                payment_reference TEXT UNIQUE,
-                amount INTEGER,
-                currency TEXT,
-                access_granted_at TEXT,
-                expires_at TEXT,
-                invite_link TEXT,
-                active INTEGER DEFAULT 0
+                authorization_code TEXT,
+                email TEXT,
+                card TEXT,
+                auto_renew INTEGER DEFAULT 0,
+                renew_failures INTEGER DEFAULT 0,
+                renewed_for TEXT,
+                updated_at TEXT
             )
             """)
             await db.execute("""
-            CREATE TABLE IF NOT EXISTS payments (
-                reference TEXT PRIMARY KEY,
-                user_id INTEGER,
-                amount INTEGER,
+            CREATE TABLE IF NOT EXISTS plans (
+                plan_type TEXT PRIMARY KEY,
+                label TEXT,
+                region TEXT,
+                emoji TEXT,
+                method TEXT,
                 currency TEXT,
-                status TEXT,
-                created_at TEXT
+                amount INTEGER,
+                hours INTEGER,
+                requires_phone INTEGER,
+                sort_order INTEGER,
+                active INTEGER DEFAULT 1,
+                channels TEXT
             )
             """)
+            await add_missing_columns(db, "plans", {"channels": "TEXT"})
+            await db.execute("UPDATE plans SET channels = ? WHERE channels IS NULL", (tenant.channel_id,))
+            await db.executemany(
+                f"INSERT OR IGNORE INTO plans ({', '.join(PLAN_COLUMNS)}) VALUES ({', '.join('?' * len(PLAN_COLUMNS))})",
+                [tuple(plan[column] for column in PLAN_COLUMNS) for plan in seed_plans(tenant.channel_id)]
+            )
             await db.commit()
-        logger.info("Database initialized")
+        logger.info("Database initialized", extra={"database": tenant.database})
     except Exception as e:
-        logger.error(f"Database init failed: {e}")
+        logger.error(f"Database init failed: {e}", extra={"database": tenant.database})
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await update.message.reply_text(
-        f"👋 Hello {user.first_name}!\n\n"
-        "Get 12 hours access to our exclusive private channel.\n\n"
-        "💰 Payment Options:\n"
-        "• 🇰🇪 Kenya: KES 60 via M-Pesa\n"
-        "• 🌍 International: $20 via Card\n\n"
-        "Use /subscribe to get access",
+        f"👋 Hello {user.first_name}!\n\n" + active_bot().plan_catalog.start_text,
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -164,72 +745,136 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2. Choose your payment method\n"
         "3. Complete payment\n"
         "4. Get instant channel access\n\n"
+        "Paying again before expiry adds to your remaining time.\n"
+        "Card payers can renew automatically with /autorenew\n\n"
         "Need help? Contact admin."
     )
 
 async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("🇰🇪 Kenya - KES 60 (M-Pesa)", callback_data="plan_kenya")],
-        [InlineKeyboardButton("🌍 International - $20 (Card)", callback_data="plan_international")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    if not admit_new_flow():
+        await update.message.reply_text(SHED_REPLY)
+        return
     
-    await update.message.reply_text(
-        "Choose your payment method (12 hours access):",
-        reply_markup=reply_markup
-    )
+    catalog = active_bot().plan_catalog
+    await update.message.reply_text(catalog.subscribe_text, reply_markup=catalog.subscribe_markup)
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
+    tenant = active_bot()
+    user_sessions = tenant.user_sessions
     user_id = query.from_user.id
     callback_data = query.data
     
     if callback_data.startswith("plan_"):
         plan_type = callback_data.replace("plan_", "")
         
-        if plan_type in SUBSCRIPTION_PLANS:
+        if not admit_new_flow():
+            await query.edit_message_text(SHED_REPLY)
+            return
+        
+        catalog = tenant.plan_catalog
+        if plan_type in catalog.offered:
             user_sessions[user_id] = UserSession(user_id)
             user_sessions[user_id].plan_type = plan_type
             
-            plan = SUBSCRIPTION_PLANS[plan_type]
-            
-            if plan_type == "kenya":
-                await query.edit_message_text(
-                    f"🇰🇪 Kenya Plan Selected\n\n"
-                    f"💰 Amount: KES {plan['amount']}\n"
-                    f"⏰ Access: {plan['hours']} hours\n"
-                    f"📱 Payment: M-Pesa\n\n"
-                    "Please send your mobile money number:\n\n"
-                    "✅ Accepted formats:\n"
-                    "• 07XXXXXXXX\n"
-                    "• 7XXXXXXXX\n"
-                    "• 2547XXXXXXXX\n"
-                    "• 2541XXXXXXXX\n"
-                    "• +2547XXXXXXXX\n\n"
-                    "Works with all providers: M-Pesa, Airtel Money, Telkom Cash"
-                )
+            if catalog.plans[plan_type]['requires_phone']:
+                await query.edit_message_text(catalog.selected_text[plan_type])
+            elif not await screen_payment_attempt(user_id):
+                user_sessions.pop(user_id, None)
+                await query.edit_message_text(VELOCITY_REPLY)
+            elif tenant.payment_provider_token:
+                await send_plan_invoice(query, context, user_id, plan_type)
             else:
                 await create_inline_payment(query, user_id, plan_type, None)
                     
     elif callback_data == "check_payment":
         await check_payment_status(query, user_id)
+    
+    elif callback_data in ("autorenew_on", "autorenew_off"):
+        await set_auto_renew(query, user_id, callback_data == "autorenew_on")
+
+async def send_plan_invoice(query, context: ContextTypes.DEFAULT_TYPE, user_id: int, plan_type: str):
+    """Send a native Telegram invoice; confirmation arrives as a successful_payment update"""
+    tenant = active_bot()
+    plan = tenant.plan_catalog.plans[plan_type]
+    # Unique per invoice, so a double tap or a second plan never overwrites a pending one,
+    # and free of the user id, which Telegram shows back in the payload
+    reference = f"inv_{uuid.uuid4().hex}"
+    try:
+        await query.edit_message_text(f"💳 {plan['label']} Plan Selected\n\nComplete the payment below:")
+        # Recorded before sending, so a paid invoice always has a pending row to reconcile against
+        await record_pending_payment(reference, user_id, plan_type, None)
+        await context.bot.send_invoice(
+            chat_id=user_id,
+            title="Private Channel Access",
+            description=f"{plan['hours']} hours access to our exclusive private channel",
+            payload=f"{plan_type}:{reference}",
+            provider_token=tenant.payment_provider_token,
+            currency=plan['currency'],
+            prices=[LabeledPrice(plan['label'], plan['amount'] * 100)]
+        )
+    except Exception as e:
+        logger.error("Invoice failed", extra={"user_id": user_id, "plan_type": plan_type, "error": str(e)})
+        await query.edit_message_text("❌ Error creating payment. Please try again or contact support.")
+    finally:
+        # The invoice payload carries everything needed later, so no session is kept
+        tenant.user_sessions.pop(user_id, None)
+
+def parse_invoice_payload(payload: str, currency: str, total_amount: int):
+    """Return the plan type for a genuine "plan_type:reference" invoice payload, or None"""
+    plan_type, _, _ = payload.partition(":")
+    plan = active_bot().plan_catalog.plans.get(plan_type)
+    if not plan or plan['currency'] != currency or plan['amount'] * 100 != total_amount:
+        return None
+    return plan_type
+
+async def precheckout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.pre_checkout_query
+    if parse_invoice_payload(query.invoice_payload, query.currency, query.total_amount):
+        await query.answer(ok=True)
+    else:
+        await query.answer(ok=False, error_message="This invoice has expired. Please use /subscribe again.")
+
+async def successful_payment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Queue the grant for a completed Telegram invoice payment"""
+    user_id = update.effective_user.id
+    payment = update.message.successful_payment
+    plan_type = parse_invoice_payload(payment.invoice_payload, payment.currency, payment.total_amount)
+    
+    try:
+        if not plan_type:
+            raise Exception(f"Unexpected invoice payload {payment.invoice_payload}")
+        
+        _, _, reference = payment.invoice_payload.partition(":")
+        if not reference.startswith("inv_"):
+            # Invoices sent before payloads carried a reference have no pending row
+            reference = payment.telegram_payment_charge_id
+            await record_pending_payment(reference, user_id, plan_type, None)
+        await record_successful_payment(user_id, plan_type, reference, None)
+        
+        await update.message.reply_text(
+            "✅ Payment received!\n\n"
+            "🎉 Your channel invite is on its way."
+        )
+        logger.info("Invoice paid", extra={"user_id": user_id, "reference": reference,
+                                           "charge_id": payment.telegram_payment_charge_id, "sampled": True})
+        
+    except Exception as e:
+        logger.error("Invoice payment handling failed", extra={"user_id": user_id, "error": str(e)})
+        await update.message.reply_text("✅ Payment successful! Please contact admin for channel access.")
 
 async def create_inline_payment(query, user_id: int, plan_type: str, phone: Optional[str]):
     """Create Paystack payment and show inline payment button"""
+    tenant = active_bot()
+    user_sessions = tenant.user_sessions
     try:
         payment_url, reference = await create_paystack_payment(user_id, plan_type, phone)
         
         user_sessions[user_id].payment_reference = reference
         
-        async with aiosqlite.connect("subscriptions.db") as db:
-            plan = SUBSCRIPTION_PLANS[plan_type]
-            await db.execute(
-                "INSERT OR REPLACE INTO payments (reference, user_id, amount, currency, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (reference, user_id, plan['amount'], plan['currency'], 'pending', datetime.now().isoformat())
-            )
-            await db.commit()
+        await record_pending_payment(reference, user_id, plan_type, phone)
         
         keyboard = [
             [InlineKeyboardButton("💳 Pay Now", url=payment_url)],
@@ -237,19 +882,10 @@ async def create_inline_payment(query, user_id: int, plan_type: str, phone: Opti
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        plan = SUBSCRIPTION_PLANS[plan_type]
-        await query.edit_message_text(
-            f"✅ Payment Ready!\n\n"
-            f"Plan: {plan['label']}\n"
-            f"Amount: {plan['amount']} {plan['currency']}\n"
-            f"Access: {plan['hours']} hours\n\n"
-            "Click 'Pay Now' to complete payment securely within Telegram.\n"
-            "After payment, click 'I've Paid' to verify.",
-            reply_markup=reply_markup
-        )
+        await query.edit_message_text(tenant.plan_catalog.payment_ready_text[plan_type], reply_markup=reply_markup)
         
     except Exception as e:
-        logger.error(f"Payment creation error: {e}")
+        logger.error("Payment creation failed", extra={"user_id": user_id, "plan_type": plan_type, "error": str(e)})
         await query.edit_message_text(
             "❌ Error creating payment. Please try again or contact support."
         )
@@ -260,25 +896,35 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     message_text = update.message.text.strip()
     
-    if user_id in user_sessions and user_sessions[user_id].plan_type == "kenya":
+    tenant = active_bot()
+    user_sessions = tenant.user_sessions
+    session = user_sessions.get(user_id)
+    if session and tenant.plan_catalog.plans[session.plan_type]['requires_phone']:
         # Validate Kenya mobile money number
         if not validate_kenya_phone(message_text):
             await update.message.reply_text(
                 "❌ Invalid mobile money number.\n\n"
-                "✅ Accepted formats:\n"
-                "• 07XXXXXXXX\n"
-                "• 7XXXXXXXX\n"
-                "• 2547XXXXXXXX\n"
-                "• 2541XXXXXXXX\n"
-                "• +2547XXXXXXXX\n\n"
-                "Please send your correct number:"
+                + PHONE_FORMATS_TEXT
+                + "Please send your correct number:"
             )
             return
         
+        if not admit_new_flow():
+            await update.message.reply_text(SHED_REPLY)
+            return
+        
         # Format phone for Paystack
         formatted_phone = format_phone_for_paystack(message_text)
         user_sessions[user_id].phone_number = formatted_phone
         
+        if not await screen_payment_attempt(user_id, formatted_phone):
+            await update.message.reply_text(VELOCITY_REPLY)
+            return
+        
+        if KENYA_PAYMENT_MODE == "stk":
+            await start_mpesa_push(update, user_id, formatted_phone, message_text)
+            return
+        
         try:
             payment_url, reference = await create_paystack_payment(
                 user_id, 
@@ -288,13 +934,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             user_sessions[user_id].payment_reference = reference
             
-            async with aiosqlite.connect("subscriptions.db") as db:
-                plan = SUBSCRIPTION_PLANS[user_sessions[user_id].plan_type]
-                await db.execute(
-                    "INSERT OR REPLACE INTO payments (reference, user_id, amount, currency, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                    (reference, user_id, plan['amount'], plan['currency'], 'pending', datetime.now().isoformat())
-                )
-                await db.commit()
+            await record_pending_payment(reference, user_id, user_sessions[user_id].plan_type, formatted_phone)
             
             keyboard = [
                 [InlineKeyboardButton("💳 Pay Now", url=payment_url)],
@@ -305,15 +945,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(
                 f"✅ Payment Ready!\n\n"
                 f"📱 Number: {message_text}\n"
-                f"💰 Amount: KES 60\n"
-                f"⏰ Access: 12 hours\n\n"
+                + tenant.plan_catalog.amount_text[session.plan_type] +
                 "Click 'Pay Now' to complete payment securely within Telegram.\n"
                 "After payment, click 'I've Paid' to verify.",
                 reply_markup=reply_markup
             )
             
         except Exception as e:
-            logger.error(f"Kenya payment error: {e}")
+            logger.error("Kenya payment creation failed", extra={"user_id": user_id, "error": str(e)})
             await update.message.reply_text("❌ Error creating payment. Please try again.")
             if user_id in user_sessions:
                 del user_sessions[user_id]
@@ -321,19 +960,102 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("Use /subscribe to start payment or /help for assistance.")
 
+async def start_mpesa_push(update: Update, user_id: int, formatted_phone: str, display_phone: str):
+    """Trigger the M-Pesa prompt on the user's phone; access is granted from the charge.success webhook"""
+    tenant = active_bot()
+    user_sessions = tenant.user_sessions
+    plan_type = user_sessions[user_id].plan_type
+    
+    try:
+        reference = await create_mpesa_charge(user_id, plan_type, formatted_phone)
+        user_sessions[user_id].payment_reference = reference
+        await record_pending_payment(reference, user_id, plan_type, formatted_phone)
+        
+        keyboard = [[InlineKeyboardButton("✅ I've Paid", callback_data="check_payment")]]
+        await update.message.reply_text(
+            f"📲 Check your phone!\n\n"
+            f"📱 Number: {display_phone}\n"
+            + tenant.plan_catalog.amount_text[plan_type] +
+            "Enter your M-Pesa PIN on the prompt to pay.\n"
+            "Your channel invite is sent here as soon as payment is confirmed.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+    except Exception as e:
+        logger.error("M-Pesa charge failed", extra={"user_id": user_id, "plan_type": plan_type, "error": str(e)})
+        await update.message.reply_text("❌ Error creating payment. Please try again.")
+        if user_id in user_sessions:
+            del user_sessions[user_id]
+
+async def record_pending_payment(reference: str, user_id: int, plan_type: str, phone: Optional[str]):
+    plan = active_bot().plan_catalog.plans[plan_type]
+    await active_bot().store.record_pending(
+        (reference, user_id, plan['amount'], plan['currency'], 'pending', clock.now().isoformat(), plan_type, phone)
+    )
+    
+    event_bus.publish("payment_created", bot=active_bot().key, user_id=user_id, plan_type=plan_type,
+                      reference=reference, amount=plan['amount'], currency=plan['currency'])
+
+async def create_mpesa_charge(user_id: int, plan_type: str, phone: str) -> str:
+    """Create a Paystack mobile money charge, which sends the STK push, and return its reference"""
+    tenant = active_bot()
+    if not tenant.paystack_secret_key:
+        raise Exception("Paystack secret key not configured")
+    
+    plan = tenant.plan_catalog.plans[plan_type]
+    
+    headers = {
+        "Authorization": f"Bearer {tenant.paystack_secret_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "email": f"user{user_id}@pouchon.com",
+        "amount": plan["amount"] * 100,
+        "currency": plan["currency"],
+        "mobile_money": {
+            "phone": f"+{phone}",
+            "provider": MPESA_PROVIDER
+        },
+        "metadata": {
+            "user_id": user_id,
+            "plan_type": plan_type,
+            "hours": plan["hours"],
+            "phone": phone
+        }
+    }
+    
+    logger.info("Creating M-Pesa charge", extra={"user_id": user_id, "plan_type": plan_type, "sampled": True})
+    
+    client = get_http_client()
+    try:
+        async with paystack_call():
+            response = await client.post(f"{PAYSTACK_API_URL}/charge", json=payload, headers=headers, timeout=30.0)
+    except httpx.HTTPError:
+        raise Exception("Payment service unavailable. Please try again.")
+    
+    data = response.json()
+    if response.status_code not in (200, 201) or not data.get("status"):
+        raise Exception(f"Charge failed: {data.get('message', response.status_code)}")
+    
+    charge = data["data"]
+    if charge.get("status") not in ("pay_offline", "pending", "success"):
+        raise Exception(f"Unexpected charge status: {charge.get('status')}")
+    
+    return charge["reference"]
+
 async def create_paystack_payment(user_id: int, plan_type: str, phone: Optional[str]):
     """Create Paystack payment"""
-    
-    if not PAYSTACK_SECRET_KEY:
+    tenant = active_bot()
+    if not tenant.paystack_secret_key:
         raise Exception("Paystack secret key not configured")
     
-    plan = SUBSCRIPTION_PLANS[plan_type]
+    plan = tenant.plan_catalog.plans[plan_type]
     
     email = f"user{user_id}@pouchon.com"
     
-    url = "https://api.paystack.co/transaction/initialize"
+    url = f"{PAYSTACK_API_URL}/transaction/initialize"
     headers = {
-        "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
+        "Authorization": f"Bearer {tenant.paystack_secret_key}",
         "Content-Type": "application/json"
     }
     
@@ -348,34 +1070,37 @@ async def create_paystack_payment(user_id: int, plan_type: str, phone: Optional[
         }
     }
     
-    if plan_type == "kenya" and phone:
+    if plan['requires_phone'] and phone:
         payload["metadata"]["phone"] = phone
         payload["channels"] = ["mobile_money"]
     
-    logger.info(f"Creating {plan_type} payment for user {user_id}")
+    logger.info("Creating payment", extra={"user_id": user_id, "plan_type": plan_type, "sampled": True})
     
-    async with httpx.AsyncClient() as client:
-        try:
+    client = get_http_client()
+    try:
+        async with paystack_call():
             response = await client.post(url, json=payload, headers=headers, timeout=30.0)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status"):
-                    return data["data"]["authorization_url"], data["data"]["reference"]
-                else:
-                    error_msg = data.get('message', 'Unknown error')
-                    raise Exception(f"Payment failed: {error_msg}")
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("status"):
+                return data["data"]["authorization_url"], data["data"]["reference"]
             else:
-                raise Exception(f"Payment service error: {response.status_code}")
-                
-        except httpx.HTTPError as e:
-            raise Exception("Payment service unavailable. Please try again.")
-        except Exception as e:
-            logger.error(f"Payment error: {e}")
-            raise e
+                error_msg = data.get('message', 'Unknown error')
+                raise Exception(f"Payment failed: {error_msg}")
+        else:
+            raise Exception(f"Payment service error: {response.status_code}")
+            
+    except httpx.HTTPError as e:
+        raise Exception("Payment service unavailable. Please try again.")
+    except Exception as e:
+        logger.error("Paystack payment initialization failed", extra={"user_id": user_id, "plan_type": plan_type, "error": str(e)})
+        raise e
 
 async def check_payment_status(query, user_id: int):
     """Check if payment was successful"""
+    tenant = active_bot()
+    user_sessions = tenant.user_sessions
     try:
         if user_id not in user_sessions:
             await query.edit_message_text("❌ Session expired. Please start over with /subscribe")
@@ -387,122 +1112,506 @@ async def check_payment_status(query, user_id: int):
             await query.edit_message_text("❌ No payment found. Please start over with /subscribe")
             return
         
-        url = f"https://api.paystack.co/transaction/verify/{reference}"
+        url = f"{PAYSTACK_API_URL}/transaction/verify/{reference}"
         headers = {
-            "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
+            "Authorization": f"Bearer {tenant.paystack_secret_key}",
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient() as client:
+        client = get_http_client()
+        async with paystack_call():
             response = await client.get(url, headers=headers, timeout=30.0)
+        
+        if response.status_code == 200:
+            data = response.json()
             
-            if response.status_code == 200:
-                data = response.json()
+            if data.get("status") and data["data"]["status"] == "success":
+                session = user_sessions[user_id]
+                await save_card_authorization(user_id, data["data"])
+                await screen_card_charge(user_id, data["data"])
+                await record_successful_payment(user_id, session.plan_type, reference, session.phone_number)
+                await query.edit_message_text(
+                    "✅ Payment Verified!\n\n"
+                    "🎉 You now have access to the private channel!\n\n"
+                    "Check your messages for the channel invite."
+                )
                 
-                if data.get("status") and data["data"]["status"] == "success":
-                    await grant_channel_access(user_id, user_sessions[user_id].plan_type)
-                    await query.edit_message_text(
-                        "✅ Payment Verified!\n\n"
-                        "🎉 You now have access to the private channel!\n\n"
-                        "Check your messages for the channel invite."
-                    )
+                if user_id in user_sessions:
+                    del user_sessions[user_id]
                     
-                    if user_id in user_sessions:
-                        del user_sessions[user_id]
-                        
-                else:
-                    await query.edit_message_text(
-                        "⏳ Payment not confirmed yet.\n\n"
-                        "If you've paid, it may take a few moments to process.\n"
-                        "Click 'I've Paid' again in 30 seconds."
-                    )
             else:
-                await query.edit_message_text("❌ Error verifying payment. Please try again.")
-                
+                await query.edit_message_text(
+                    "⏳ Payment not confirmed yet.\n\n"
+                    "If you've paid, it may take a few moments to process.\n"
+                    "Click 'I've Paid' again in 30 seconds."
+                )
+        else:
+            await query.edit_message_text("❌ Error verifying payment. Please try again.")
+            
     except Exception as e:
-        logger.error(f"Payment verification error: {e}")
+        logger.error("Payment verification failed", extra={"user_id": user_id, "error": str(e)})
         await query.edit_message_text("❌ Error checking payment. Please try again.")
 
-async def grant_channel_access(user_id: int, plan_type: str):
-    """Grant access to private channel"""
+async def screen_payment_attempt(user_id: int, phone: Optional[str] = None) -> bool:
+    """Count a payment creation against the velocity rules; False means refuse it"""
+    subjects = {"user": user_id, "phone": phone}
+    hits = velocity_guard.record("payment_attempt", subjects, clock.time())
+    for rule, subject, count, first_trip in hits:
+        if first_trip:
+            await record_fraud_event(rule, subject, user_id, count)
+    
+    blocked = velocity_guard.is_blocked(subjects) or any(rule.action == "block" for rule, *_ in hits)
+    if blocked:
+        logger.warning("Payment attempt refused", extra={"user_id": user_id, "rules": [hit[0].name for hit in hits]})
+    return not blocked
+
+async def screen_card_charge(user_id: int, charge: dict):
+    """Flag cards paying for many different accounts; the payment itself already went through"""
+    signature = (charge.get("authorization") or {}).get("signature")
+    if not signature:
+        return
+    for rule, subject, count, first_trip in velocity_guard.record(
+        "card_charge", {"card": signature, "user": user_id}, clock.time()
+    ):
+        if first_trip:
+            await record_fraud_event(rule, subject, user_id, count)
+
+async def record_fraud_event(rule, subject: str, user_id: int, count: int):
+    """Queue a tripped rule for admin review and alert the admins"""
+    tenant = active_bot()
     try:
-        bot = bot_app.bot if bot_app else Bot(token=BOT_TOKEN)
-        
-        invite_link = await bot.create_chat_invite_link(
-            chat_id=PRIVATE_CHANNEL_ID,
-            member_limit=1,
-            expire_date=timedelta(hours=12)
+        # One review queue for all bots; velocity counters are shared too, since user ids are global
+        async with aiosqlite.connect(default_bot.database) as db:
+            await db.execute(
+                """INSERT INTO fraud_events (created_at, rule, subject, user_id, count, action, bot_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (clock.now().isoformat(), rule.name, subject, user_id, count, rule.action, tenant.key)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Fraud event write failed: {e}")
+    
+    logger.warning("Velocity rule tripped", extra={"rule": rule.name, "subject": subject, "count": count})
+    event_bus.publish("velocity_flag", bot=tenant.key, rule=rule.name, action=rule.action, subject=subject, count=count)
+    # Admins hear from the default bot, which they have started, whichever bot the attempt came through
+    notifier = default_bot if default_bot.application else tenant
+    if ADMIN_USER_IDS and notifier.application:
+        text = f"🚩 Velocity rule {rule.name} ({rule.action}): {subject} reached {count} in {rule.window // 60} min"
+        if tenant is not default_bot:
+            text += f" on bot {tenant.key}"
+        with bot_context(notifier):
+            await send_batched_messages([(admin_id, text) for admin_id in ADMIN_USER_IDS])
+
+async def load_velocity_state():
+    try:
+        async with aiosqlite.connect(default_bot.database) as db:
+            cursor = await db.execute("SELECT state FROM velocity_state WHERE id = 1")
+            row = await cursor.fetchone()
+            cursor = await db.execute("SELECT subject FROM fraud_blocklist")
+            velocity_guard.blocked = {subject for subject, in await cursor.fetchall()}
+        if row:
+            velocity_guard.restore(orjson.loads(row[0]))
+            velocity_guard.prune(clock.time())
+    except Exception as e:
+        logger.error(f"Velocity state load failed: {e}")
+
+async def save_velocity_state():
+    velocity_guard.prune(clock.time())
+    state = orjson.dumps(velocity_guard.snapshot()).decode()
+    async with aiosqlite.connect(default_bot.database) as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO velocity_state (id, state, saved_at) VALUES (1, ?, ?)",
+            (state, clock.now().isoformat())
         )
+        await db.commit()
+
+async def run_velocity_persistence():
+    """Snapshot the velocity windows periodically and once more on shutdown"""
+    stopping = False
+    while not stopping:
+        stopping = await wait_for_shutdown(VELOCITY_PERSIST_SECONDS)
+        try:
+            await save_velocity_state()
+        except Exception as e:
+            logger.error(f"Velocity state save failed: {e}")
+
+async def save_card_authorization(user_id: int, charge: dict):
+    """Keep a reusable card authorization from a successful charge for auto-renew"""
+    authorization = charge.get("authorization") or {}
+    if not authorization.get("reusable") or authorization.get("channel") != "card":
+        return
+    
+    email = (charge.get("customer") or {}).get("email") or f"user{user_id}@pouchon.com"
+    card = f"{authorization.get('brand', 'card')} ****{authorization.get('last4', '')}"
+    async with aiosqlite.connect(active_bot().database) as db:
+        await db.execute(
+            """INSERT INTO payment_authorizations (user_id, authorization_code, email, card, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET authorization_code = excluded.authorization_code,
+                email = excluded.email, card = excluded.card, renew_failures = 0, updated_at = excluded.updated_at""",
+            (user_id, authorization["authorization_code"], email, card, clock.now().isoformat())
+        )
+        await db.commit()
+
+async def record_successful_payment(user_id: int, plan_type: str, reference: str, phone: Optional[str]):
+    """Mark the payment successful and queue its grant in one transaction"""
+    # A payment is granted once, however many times "I've Paid" is clicked
+    queued = await active_bot().store.record_success(reference, user_id, plan_type, phone, clock.now().isoformat())
+    
+    if queued:
+        event_bus.publish("payment_verified", bot=active_bot().key, user_id=user_id, plan_type=plan_type,
+                          reference=reference)
+    if grant_outbox_event:
+        grant_outbox_event.set()
+
+async def gather_bounded(coros, limit: int) -> list:
+    """asyncio.gather with at most `limit` of the awaitables running at once"""
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def run(coro):
+        async with semaphore:
+            return await coro
+    
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+def parse_outbox_links(value: Optional[str]) -> dict:
+    """channel_id -> invite link stored on a grant_outbox row"""
+    if not value:
+        return {}
+    # Rows queued before bundles hold a single bare link
+    if not value.startswith("{"):
+        return {active_bot().channel_id: value}
+    return orjson.loads(value)
+
+async def grant_channel_access(entry: dict):
+    """Grant or extend access to every channel of the plan for one outbox entry; safe to replay"""
+    tenant = active_bot()
+    bot = tenant.application.bot
+    channel_membership = tenant.channel_membership
+    user_id = entry["user_id"]
+    plan = tenant.plan_catalog.plans[entry["plan_type"]]
+    links = parse_outbox_links(entry["invite_link"])
+    
+    async with aiosqlite.connect(tenant.database) as db:
+        cursor = await db.execute("SELECT expires_at, active FROM subscriptions WHERE user_id = ?", (user_id,))
+        current = await cursor.fetchone()
+        cursor = await db.execute(
+            "SELECT 1 FROM applied_grants WHERE payment_reference = ?", (entry["payment_reference"],)
+        )
+        applied = await cursor.fetchone() is not None
+        cursor = await db.execute(
+            "SELECT auto_renew FROM payment_authorizations WHERE user_id = ?", (user_id,)
+        )
+        authorization = await cursor.fetchone()
+    
+    current_expiry = datetime.fromisoformat(current[0]) if current and current[0] and current[1] else None
+    
+    # A replay after the subscription was written finds this payment applied and only resends the message
+    if not applied:
+        # Renewals stack on the remaining time; channels the user is still in need no new link
+        renewing = current_expiry is not None and current_expiry > clock.now()
+        expires_at = (current_expiry if renewing else clock.now()) + timedelta(hours=plan['hours'])
         
-        async with aiosqlite.connect("subscriptions.db") as db:
-            plan = SUBSCRIPTION_PLANS[plan_type]
-            expires_at = datetime.now() + timedelta(hours=plan['hours'])
-            
+        if not links:
+            needs_link = [
+                channel_id for channel_id in plan['channels']
+                if not (renewing and channel_membership.get((user_id, channel_id)))
+            ]
+            link_expires = clock.now(timezone.utc) + timedelta(hours=12)
+            created_links = await gather_bounded(
+                (bot.create_chat_invite_link(chat_id=channel_id, member_limit=1, expire_date=link_expires)
+                 for channel_id in needs_link),
+                INVITE_LINK_CONCURRENCY
+            )
+            links = dict.fromkeys(plan['channels'])
+            links.update((channel_id, link.invite_link) for channel_id, link in zip(needs_link, created_links))
+            # Saved before the subscription so a replay reuses these links instead of creating more
+            await tenant.store.save_grant_links(entry, orjson.dumps(links).decode())
+        new_links = [link for link in links.values() if link]
+        
+        async with aiosqlite.connect(tenant.database) as db:
             await db.execute(
-                """INSERT OR REPLACE INTO subscriptions 
+                """INSERT INTO subscriptions 
                 (user_id, plan_type, phone_number, payment_reference, amount, currency, 
                  access_granted_at, expires_at, invite_link, active) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (user_id, plan_type, 
-                 user_sessions[user_id].phone_number if user_id in user_sessions else None,
-                 user_sessions[user_id].payment_reference if user_id in user_sessions else None,
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    plan_type = excluded.plan_type, phone_number = excluded.phone_number,
+                    payment_reference = excluded.payment_reference, amount = excluded.amount,
+                    currency = excluded.currency, access_granted_at = excluded.access_granted_at,
+                    expires_at = excluded.expires_at,
+                    invite_link = COALESCE(excluded.invite_link, invite_link), active = 1""",
+                (user_id, entry["plan_type"], entry["phone_number"], entry["payment_reference"],
                  plan['amount'], plan['currency'],
-                 datetime.now().isoformat(), expires_at.isoformat(),
-                 invite_link.invite_link, 1)
+                 clock.now().isoformat(), expires_at.isoformat(),
+                 new_links[0] if new_links else None)
+            )
+            # Channels from an earlier plan stay until this subscription expires
+            await db.executemany(
+                """INSERT INTO subscription_channels (user_id, channel_id, invite_link) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, channel_id) DO UPDATE SET
+                    invite_link = COALESCE(excluded.invite_link, invite_link)""",
+                [(user_id, channel_id, link) for channel_id, link in links.items()]
             )
-            await db.commit()
-        
-        async with aiosqlite.connect("subscriptions.db") as db:
             await db.execute(
-                "UPDATE payments SET status = ? WHERE reference = ?",
-                ('success', user_sessions[user_id].payment_reference if user_id in user_sessions else None)
+                "INSERT INTO applied_grants (payment_reference, user_id, applied_at) VALUES (?, ?, ?)",
+                (entry["payment_reference"], user_id, clock.now().isoformat())
             )
             await db.commit()
         
-        await bot.send_message(
-            chat_id=user_id,
-            text=f"🎉 Welcome to the Private Channel!\n\n"
-                 f"Click here to join: {invite_link.invite_link}\n\n"
-                 f"⏰ Access expires in {plan['hours']} hours\n"
-                 f"Enjoy the content!",
-            parse_mode=ParseMode.MARKDOWN
+        schedule_expiry(user_id, expires_at)
+        for channel_id, link in links.items():
+            if link:
+                channel_membership.setdefault((user_id, channel_id), False)
+    else:
+        expires_at = current_expiry or clock.now() + timedelta(hours=plan['hours'])
+    
+    new_links = [link for link in links.values() if link]
+    hours_left = max(round((expires_at - clock.now()).total_seconds() / 3600), 1)
+    if not new_links:
+        text = (
+            "🔁 Access extended!\n\n"
+            f"⏰ Access now expires in {hours_left} hours ({expires_at.strftime('%Y-%m-%d %H:%M')})\n"
+            "Enjoy the content!"
         )
-        
-        logger.info(f"Access granted to user {user_id} for {plan_type} plan")
+    else:
+        if len(new_links) == 1:
+            join_text = f"Click here to join: {new_links[0]}\n\n"
+        else:
+            join_text = "Join your channels:\n" + "".join(
+                f"{number}. {link}\n" for number, link in enumerate(new_links, 1)
+            ) + "\n"
+        text = (
+            f"🎉 Welcome to the Private Channel{'s' if len(links) > 1 else ''}!\n\n"
+            f"{join_text}"
+            f"⏰ Access expires in {hours_left} hours\n"
+            "Enjoy the content!"
+        )
+    
+    reply_markup = None
+    if authorization and not authorization[0]:
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Turn on auto-renew", callback_data="autorenew_on")]])
+    
+    await bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
+    
+    logger.info("Access granted", extra={
+        "user_id": user_id, "plan_type": entry["plan_type"], "channels": len(links), "new_links": len(new_links),
+        "sampled": True
+    })
+    event_bus.publish("access_granted", bot=tenant.key, user_id=user_id, plan_type=entry["plan_type"],
+                      expires_at=expires_at.isoformat(), channels=len(links), extended=not new_links)
+
+async def dispatch_grant(entry: dict):
+    """Run one grant and record the outcome, backing off between failed attempts"""
+    try:
+        await grant_channel_access(entry)
+        status, next_attempt_at, error = 'done', None, None
         
     except Exception as e:
-        logger.error(f"Channel access error: {e}")
+        attempts = entry["attempts"] + 1
+        error = str(e)
+        logger.error("Channel access failed", extra={
+            "user_id": entry["user_id"], "reference": entry["payment_reference"], "attempt": attempts, "error": error
+        })
+        
+        if attempts < GRANT_MAX_ATTEMPTS:
+            status = 'pending'
+            delay = GRANT_RETRY_BASE_SECONDS * 2 ** entry["attempts"]
+            next_attempt_at = (clock.now() + timedelta(seconds=delay)).isoformat()
+        else:
+            status, next_attempt_at = 'failed', None
+            try:
+                await active_bot().application.bot.send_message(
+                    chat_id=entry["user_id"],
+                    text="✅ Payment successful! Please contact admin for channel access."
+                )
+            except Exception:
+                pass
+    
+    return (status, next_attempt_at, error, entry)
+
+async def dispatch_grant_batch() -> int:
+    """Run the active bot's next batch of due outbox entries and return its size"""
+    store = active_bot().store
+    entries = await store.due_grants(clock.now().isoformat(), GRANT_BATCH_SIZE)
+    if not entries:
+        return 0
+
+    # A user's grants stack on each other's expiry, so two in one batch (a renewal and a
+    # top-up, say) run in order; run together both would read the same starting expiry
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry["user_id"], []).append(entry)
+
+    async def dispatch_in_order(user_entries):
+        return [await dispatch_grant(entry) for entry in user_entries]
+
+    results = [
+        result for user_results in await asyncio.gather(*map(dispatch_in_order, by_user.values()))
+        for result in user_results
+    ]
+    await store.finish_grants(results)
+    return len(entries)
+
+async def run_grant_dispatcher():
+    """Drain every bot's grant outbox in concurrent batches; pending rows survive restarts"""
+    while not (shutdown_event and shutdown_event.is_set()):
+        # Cleared before the pass so a grant queued during it wakes the next one
+        grant_outbox_event.clear()
+        backlog = False
+        for tenant in running_bots():
+            with bot_context(tenant):
+                try:
+                    backlog |= await dispatch_grant_batch() == GRANT_BATCH_SIZE
+                except Exception as e:
+                    logger.error("Grant dispatcher failed", extra={"bot": tenant.key, "error": str(e)})
+        if backlog:
+            continue
+        
         try:
-            await bot.send_message(
-                chat_id=user_id,
-                text="✅ Payment successful! Please contact admin for channel access."
-            )
-        except:
+            await asyncio.wait_for(grant_outbox_event.wait(), timeout=GRANT_POLL_SECONDS)
+        except asyncio.TimeoutError:
             pass
 
+async def chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Track joins/leaves in the private channels and revoke single-use invite links once used"""
+    member_update: ChatMemberUpdated = update.chat_member
+    channel_id = str(member_update.chat.id)
+    tenant = active_bot()
+    if channel_id not in tenant.plan_catalog.channels:
+        return
+    
+    user_id = member_update.new_chat_member.user.id
+    was_member = is_channel_member(member_update.old_chat_member)
+    is_member = is_channel_member(member_update.new_chat_member)
+    
+    if is_member == was_member:
+        return
+    
+    try:
+        if not is_member:
+            # Cleared so a restart doesn't rehydrate them as joined and a renewal sends a fresh link
+            tenant.channel_membership.pop((user_id, channel_id), None)
+            async with aiosqlite.connect(tenant.database) as db:
+                await db.execute(
+                    "UPDATE subscription_channels SET joined_at = NULL WHERE user_id = ? AND channel_id = ?",
+                    (user_id, channel_id)
+                )
+                await db.commit()
+            logger.info("User left channel", extra={"user_id": user_id, "channel_id": channel_id})
+            return
+        
+        tenant.channel_membership[(user_id, channel_id)] = True
+        async with aiosqlite.connect(tenant.database) as db:
+            await db.execute(
+                "UPDATE subscription_channels SET joined_at = ? WHERE user_id = ? AND channel_id = ?",
+                (member_update.date.isoformat(), user_id, channel_id)
+            )
+            await db.commit()
+        
+        invite_link = member_update.invite_link
+        if invite_link and invite_link.creator.id == context.bot.id:
+            await context.bot.revoke_chat_invite_link(chat_id=channel_id, invite_link=invite_link.invite_link)
+        
+        logger.info("User joined channel", extra={"user_id": user_id, "channel_id": channel_id})
+        
+    except Exception as e:
+        logger.error(f"Chat member update error: {e}")
+
+def is_channel_member(member: ChatMember) -> bool:
+    if member.status in (ChatMember.OWNER, ChatMember.ADMINISTRATOR, ChatMember.MEMBER):
+        return True
+    return member.status == ChatMember.RESTRICTED and member.is_member
+
+async def autorenew_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    
+    async with aiosqlite.connect(active_bot().database) as db:
+        cursor = await db.execute(
+            "SELECT card, auto_renew FROM payment_authorizations WHERE user_id = ?", (user_id,)
+        )
+        authorization = await cursor.fetchone()
+    
+    if not authorization:
+        await update.message.reply_text(
+            "🔁 Auto-renew works with card payments.\n\n"
+            "Pay for a plan by card with /subscribe, then turn it on here."
+        )
+        return
+    
+    card, auto_renew = authorization
+    if auto_renew:
+        text = f"🔁 Auto-renew is ON\n\nYour {card} is charged {RENEWAL_LEAD_MINUTES} minutes before access expires."
+        button = InlineKeyboardButton("Turn off auto-renew", callback_data="autorenew_off")
+    else:
+        text = f"🔁 Auto-renew is OFF\n\nTurn it on to renew automatically with your {card}."
+        button = InlineKeyboardButton("🔁 Turn on auto-renew", callback_data="autorenew_on")
+    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[button]]))
+
+async def set_auto_renew(query, user_id: int, enabled: bool):
+    async with aiosqlite.connect(active_bot().database) as db:
+        cursor = await db.execute(
+            "UPDATE payment_authorizations SET auto_renew = ?, renew_failures = 0 WHERE user_id = ?",
+            (int(enabled), user_id)
+        )
+        await db.commit()
+        updated = cursor.rowcount
+    
+    # The button may sit under an invite link, so reply instead of editing the message
+    await query.edit_message_reply_markup(reply_markup=None)
+    if not updated:
+        await query.message.reply_text("❌ No saved card found. Pay by card with /subscribe first.")
+    elif enabled:
+        await query.message.reply_text("✅ Auto-renew is on. Use /autorenew to turn it off.")
+    else:
+        await query.message.reply_text("✅ Auto-renew is off.")
+
+async def reload_plans_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    
+    try:
+        catalog = await reload_plans()
+        await update.message.reply_text(f"✅ Plans reloaded: {', '.join(catalog.offered)}")
+    except Exception as e:
+        logger.error(f"Plan reload error: {e}")
+        await update.message.reply_text(f"❌ Plan reload failed: {e}")
+
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     try:
-        async with aiosqlite.connect("subscriptions.db") as db:
+        async with aiosqlite.connect(active_bot().database) as db:
             cursor = await db.execute(
                 "SELECT plan_type, expires_at, active FROM subscriptions WHERE user_id = ?", 
                 (user_id,)
             )
             subscription = await cursor.fetchone()
+            cursor = await db.execute("SELECT channel_id FROM subscription_channels WHERE user_id = ?", (user_id,))
+            channel_ids = [channel_id for channel_id, in await cursor.fetchall()]
         
         if subscription:
             plan_type, expires_at, active = subscription
             expires_date = datetime.fromisoformat(expires_at)
             
-            if active and expires_date > datetime.now():
-                remaining = expires_date - datetime.now()
-                hours = remaining.seconds // 3600
-                minutes = (remaining.seconds % 3600) // 60
+            remaining = expires_date - clock.now()
+            if active and remaining > timedelta(0):
+                # Stacked renewals can leave more than a day
+                hours, minutes = divmod(int(remaining.total_seconds()) // 60, 60)
+                
+                tenant = active_bot()
+                joined = sum(1 for channel_id in channel_ids if tenant.channel_membership.get((user_id, channel_id)))
+                if len(channel_ids) > 1:
+                    channel_status = f"Channels: {joined}/{len(channel_ids)} joined"
+                elif joined:
+                    channel_status = "Channel: ✅ Joined"
+                else:
+                    channel_status = "Channel: ⏳ Not joined yet - use your invite link"
                 
                 await update.message.reply_text(
                     f"✅ Active Subscription\n\n"
-                    f"Plan: {SUBSCRIPTION_PLANS[plan_type]['label']}\n"
+                    f"Plan: {tenant.plan_catalog.plans[plan_type]['label']}\n"
+                    f"{channel_status}\n"
                     f"Time left: {hours}h {minutes}m\n"
                     f"Expires: {expires_date.strftime('%Y-%m-%d %H:%M')}"
                 )
@@ -515,21 +1624,712 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Status error: {e}")
         await update.message.reply_text("❌ Error checking status. Please try again.")
 
+def schedule_expiry(user_id: int, expires_at: datetime):
+    """Schedule the reminder DM and the revocation for a subscription, replacing earlier timers"""
+    # One wheel serves every bot; timers are keyed by bot since a user may subscribe through several
+    bot_key = active_bot().key
+    reminder_at = expires_at - timedelta(minutes=EXPIRY_REMINDER_MINUTES)
+    if reminder_at > clock.now():
+        expiry_wheel.schedule(("reminder", bot_key, user_id), reminder_at.timestamp(), user_id)
+    else:
+        expiry_wheel.cancel(("reminder", bot_key, user_id))
+    expiry_wheel.schedule(("expiry", bot_key, user_id), expires_at.timestamp(), user_id)
+
+async def rehydrate_expiry_schedule():
+    """Load timers and known memberships for the active bot's subscriptions from its database"""
+    channel_membership = active_bot().channel_membership
+    try:
+        count = 0
+        async with aiosqlite.connect(active_bot().database) as db:
+            async with db.execute(
+                "SELECT user_id, expires_at FROM subscriptions WHERE active = 1 AND expires_at IS NOT NULL"
+            ) as cursor:
+                async for user_id, expires_at in cursor:
+                    schedule_expiry(user_id, datetime.fromisoformat(expires_at))
+                    count += 1
+            async with db.execute(
+                "SELECT user_id, channel_id FROM subscription_channels WHERE joined_at IS NOT NULL"
+            ) as cursor:
+                async for user_id, channel_id in cursor:
+                    channel_membership[(user_id, channel_id)] = True
+        logger.info(f"Expiry scheduler loaded {count} subscriptions")
+    except Exception as e:
+        logger.error(f"Expiry schedule rehydration failed: {e}")
+
+async def send_batched_messages(messages: list):
+    """Send (chat_id, text) pairs from the active bot concurrently in rate-limited batches"""
+    bot = active_bot().application.bot
+    sent = 0
+    for i in range(0, len(messages), OUTBOUND_BATCH_SIZE):
+        batch = messages[i:i + OUTBOUND_BATCH_SIZE]
+        results = await asyncio.gather(
+            *(bot.send_message(chat_id=chat_id, text=text) for chat_id, text in batch),
+            return_exceptions=True
+        )
+        sent += sum(1 for result in results if not isinstance(result, Exception))
+        if i + OUTBOUND_BATCH_SIZE < len(messages):
+            await clock.sleep(1)
+    return sent
+
+async def send_expiry_reminders(user_ids: list):
+    text = (
+        f"⏰ Your access expires in {EXPIRY_REMINDER_MINUTES} minutes.\n\n"
+        "Use /subscribe to keep your access."
+    )
+    sent = await send_batched_messages([(user_id, text) for user_id in user_ids])
+    logger.info("Expiry reminders sent", extra={"sent": sent, "due": len(user_ids)})
+
+async def revoke_expired_access(user_ids: list):
+    """Deactivate expired subscriptions, remove users from their channels and notify them"""
+    now = clock.now().isoformat()
+    expired = []
+    grants = []
+    async with aiosqlite.connect(active_bot().database) as db:
+        # Only users this sweep deactivates are acted on; renewed or already-expired ones are left alone
+        for i in range(0, len(user_ids), 500):
+            batch = user_ids[i:i + 500]
+            cursor = await db.execute(
+                f"""UPDATE subscriptions SET active = 0
+                WHERE active = 1 AND expires_at <= ? AND user_id IN ({', '.join('?' * len(batch))})
+                RETURNING user_id""",
+                (now, *batch)
+            )
+            expired.extend(user_id for user_id, in await cursor.fetchall())
+        for i in range(0, len(expired), 500):
+            batch = expired[i:i + 500]
+            cursor = await db.execute(
+                f"SELECT user_id, channel_id FROM subscription_channels WHERE user_id IN ({', '.join('?' * len(batch))})",
+                batch
+            )
+            grants.extend(await cursor.fetchall())
+        await db.executemany(
+            "DELETE FROM subscription_channels WHERE user_id = ? AND channel_id = ?",
+            grants
+        )
+        await db.commit()
+    
+    # Users known never to have joined need no ban/unban; unknown membership is treated as joined
+    tenant = active_bot()
+    members = [grant for grant in grants if tenant.channel_membership.pop(tuple(grant), None) is not False]
+    
+    bot = tenant.application.bot
+    for i in range(0, len(members), OUTBOUND_BATCH_SIZE):
+        batch = members[i:i + OUTBOUND_BATCH_SIZE]
+        # Ban + unban removes the member without blocking a future rejoin
+        await asyncio.gather(
+            *(bot.ban_chat_member(chat_id=channel_id, user_id=user_id) for user_id, channel_id in batch),
+            return_exceptions=True
+        )
+        await asyncio.gather(
+            *(bot.unban_chat_member(chat_id=channel_id, user_id=user_id, only_if_banned=True)
+              for user_id, channel_id in batch),
+            return_exceptions=True
+        )
+    
+    text = "⌛ Your access has expired.\n\nUse /subscribe to get access again."
+    sent = await send_batched_messages([(user_id, text) for user_id in expired])
+    logger.info("Expired access revoked", extra={"revoked": len(expired), "channels": len(grants), "notified": sent})
+    if expired:
+        # One event per sweep batch keeps mass expiries from flooding the viewers' buffers
+        event_bus.publish("access_expired", bot=tenant.key, count=len(expired), user_ids=expired[:50])
+
+async def run_expiry_tick() -> int:
+    """Advance the timing wheel and fire due reminders/expiries in batches per bot; returns how many fired"""
+    due = expiry_wheel.advance(clock.time())
+    # bot key -> (reminders, expiries)
+    batches = {}
+    for (kind, bot_key, _), user_id in due:
+        batches.setdefault(bot_key, ([], []))[kind == "expiry"].append(user_id)
+    
+    for bot_key, (reminders, expiries) in batches.items():
+        with bot_context(bots[bot_key]):
+            try:
+                if reminders:
+                    await send_expiry_reminders(reminders)
+                if expiries:
+                    await revoke_expired_access(expiries)
+            except Exception as e:
+                logger.error(f"Expiry scheduler error: {e}", extra={"bot": bot_key})
+    return len(due)
+
+async def run_expiry_scheduler():
+    while not await wait_for_shutdown(SCHEDULER_TICK_SECONDS):
+        await run_expiry_tick()
+
+async def charge_saved_card(renewal: dict) -> bool:
+    """Charge one renewal against the saved authorization; access follows through the grant outbox"""
+    user_id, plan_type = renewal["user_id"], renewal["plan_type"]
+    tenant = active_bot()
+    plan = tenant.plan_catalog.plans.get(plan_type)
+    if not plan or not plan["active"] or plan["requires_phone"]:
+        return False
+    
+    reference = f"renew_{user_id}_{int(clock.time())}"
+    try:
+        await record_pending_payment(reference, user_id, plan_type, None)
+        client = get_http_client()
+        async with paystack_call():
+            response = await client.post(
+                f"{PAYSTACK_API_URL}/transaction/charge_authorization",
+                json={
+                    "authorization_code": renewal["authorization_code"],
+                    "email": renewal["email"],
+                    "amount": plan["amount"] * 100,
+                    "currency": plan["currency"],
+                    "reference": reference,
+                    "metadata": {"user_id": user_id, "plan_type": plan_type, "hours": plan["hours"], "renewal": True}
+                },
+                headers={"Authorization": f"Bearer {tenant.paystack_secret_key}", "Content-Type": "application/json"},
+                timeout=30.0
+            )
+        data = response.json()
+        # Anything short of an immediate success (e.g. send_otp) is treated as declined;
+        # a later charge.success webhook for the reference still grants
+        if response.status_code != 200 or not data.get("status") or data["data"].get("status") != "success":
+            logger.warning("Renewal declined", extra={"user_id": user_id, "reason": data.get("message")})
+            return False
+        
+        await record_successful_payment(user_id, plan_type, reference, None)
+        return True
+        
+    except Exception as e:
+        logger.error("Renewal charge failed", extra={"user_id": user_id, "error": str(e)})
+        return False
+
+async def run_renewal_batch() -> int:
+    """Charge the next batch of auto-renew subscriptions that expire within the lead time"""
+    now = clock.now()
+    async with aiosqlite.connect(active_bot().database) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """SELECT s.user_id, s.plan_type, s.expires_at, pa.authorization_code, pa.email, pa.renew_failures
+            FROM subscriptions s JOIN payment_authorizations pa ON pa.user_id = s.user_id
+            WHERE s.active = 1 AND s.expires_at > ? AND s.expires_at <= ? AND pa.auto_renew = 1
+            AND (pa.renewed_for IS NULL OR pa.renewed_for != s.expires_at)
+            LIMIT ?""",
+            (now.isoformat(), (now + timedelta(minutes=RENEWAL_LEAD_MINUTES)).isoformat(), RENEWAL_BATCH_SIZE)
+        )
+        renewals = [dict(row) for row in await cursor.fetchall()]
+        # Claim each expiry before charging so a crash mid-run never charges twice for it
+        await db.executemany(
+            "UPDATE payment_authorizations SET renewed_for = ? WHERE user_id = ?",
+            [(renewal["expires_at"], renewal["user_id"]) for renewal in renewals]
+        )
+        await db.commit()
+    
+    if not renewals:
+        return 0
+    
+    results = await gather_bounded((charge_saved_card(renewal) for renewal in renewals), RENEWAL_CONCURRENCY)
+    failed = [renewal for renewal, ok in zip(renewals, results) if not ok]
+    
+    async with aiosqlite.connect(active_bot().database) as db:
+        await db.executemany(
+            "UPDATE payment_authorizations SET renew_failures = 0 WHERE user_id = ?",
+            [(renewal["user_id"],) for renewal, ok in zip(renewals, results) if ok]
+        )
+        await db.executemany(
+            """UPDATE payment_authorizations SET renew_failures = renew_failures + 1,
+            auto_renew = (renew_failures + 1 < ?) WHERE user_id = ?""",
+            [(RENEWAL_MAX_FAILURES, renewal["user_id"]) for renewal in failed]
+        )
+        await db.commit()
+    
+    messages = []
+    for renewal in failed:
+        text = "⚠️ Auto-renew payment failed.\n\nUse /subscribe before your access expires to keep it."
+        if renewal["renew_failures"] + 1 >= RENEWAL_MAX_FAILURES:
+            text += "\nAuto-renew has been turned off; use /autorenew to turn it back on."
+        messages.append((renewal["user_id"], text))
+    await send_batched_messages(messages)
+    
+    logger.info("Renewal run", extra={"charged": len(renewals) - len(failed), "failed": len(failed)})
+    return len(renewals)
+
+async def run_renewals():
+    while not await wait_for_shutdown(RENEWAL_INTERVAL_MINUTES * 60):
+        for tenant in running_bots():
+            with bot_context(tenant):
+                try:
+                    while await run_renewal_batch() == RENEWAL_BATCH_SIZE:
+                        pass
+                except Exception as e:
+                    logger.error(f"Renewal run error: {e}", extra={"bot": tenant.key})
+
+async def archive_old_rows():
+    """Move rows past the retention window into the archive and compact the database"""
+    tenant = active_bot()
+    cutoff = clock.now() - timedelta(days=ARCHIVE_RETENTION_DAYS)
+    archived = await tenant.store.archive(cutoff, ARCHIVE_BATCH_SIZE, tenant.archive_dir)
+    async with aiosqlite.connect(tenant.database) as db:
+        for table in ARCHIVE_TABLES:
+            if table not in STORE_TABLES:
+                archived[table] = await archive_table(db, table, cutoff, ARCHIVE_BATCH_SIZE, tenant.archive_dir)
+        
+        freed = 0
+        while True:
+            cursor = await db.execute("PRAGMA freelist_count")
+            free_pages = (await cursor.fetchone())[0]
+            if not free_pages:
+                break
+            await db.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+            await db.commit()
+            freed += min(free_pages, VACUUM_STEP_PAGES)
+            await asyncio.sleep(0)
+    
+    logger.info("Archive run complete", extra={"bot": tenant.key, "archived": archived, "freed_pages": freed})
+
+async def run_archiver():
+    while True:
+        for tenant in running_bots():
+            with bot_context(tenant):
+                try:
+                    await archive_old_rows()
+                except Exception as e:
+                    logger.error(f"Archiver error: {e}", extra={"bot": tenant.key})
+        if await wait_for_shutdown(ARCHIVE_INTERVAL_HOURS * 3600):
+            return
+
+async def run_backups():
+    """Take periodic online snapshots in a worker thread so the event loop never waits on them"""
+    while not await wait_for_shutdown(BACKUP_INTERVAL_HOURS * 3600):
+        for tenant in running_bots():
+            # Store shards are backed up alongside the bot's database
+            for database in dict.fromkeys((tenant.database, *tenant.store.files)):
+                try:
+                    started = time.monotonic()
+                    path = await asyncio.to_thread(create_backup, database)
+                    removed = await asyncio.to_thread(prune_backups, database_path=database)
+                    logger.info("Database backup written", extra={
+                        "path": path,
+                        "seconds": round(time.monotonic() - started, 2),
+                        "pruned": len(removed)
+                    })
+                except Exception as e:
+                    logger.error(f"Backup failed: {e}", extra={"bot": tenant.key, "database": database})
+
+async def load_plan_catalog() -> PlanCatalog:
+    """Rebuild the active bot's catalog from its plans table and swap it in with one assignment"""
+    tenant = active_bot()
+    async with aiosqlite.connect(tenant.database) as db:
+        cursor = await db.execute(f"SELECT {', '.join(PLAN_COLUMNS)} FROM plans")
+        rows = await cursor.fetchall()
+    catalog = PlanCatalog(rows)
+    if not catalog.offered:
+        raise Exception("No active plans in the plans table")
+    tenant.plan_catalog = catalog
+    logger.info("Plan catalog loaded", extra={
+        "bot": tenant.key, "plans": len(catalog.plans), "offered": list(catalog.offered)
+    })
+    return catalog
+
+async def sync_plans_file(path: str) -> PlanCatalog:
+    """Upsert the plans from a JSON file into the table, then reload the catalog"""
+    rows = await asyncio.to_thread(load_plans_file, path)
+    async with aiosqlite.connect(active_bot().database) as db:
+        cursor = await db.execute(f"SELECT {', '.join(PLAN_COLUMNS)} FROM plans")
+        merged = {row[0]: row for row in await cursor.fetchall()}
+        merged.update((row[0], row) for row in rows)
+        # Validate the catalog the table would end up with, so a bad or all-inactive file never reaches it
+        if not PlanCatalog(list(merged.values())).offered:
+            raise Exception(f"No active plans after applying {path}")
+        await db.executemany(
+            f"INSERT OR REPLACE INTO plans ({', '.join(PLAN_COLUMNS)}) VALUES ({', '.join('?' * len(PLAN_COLUMNS))})",
+            rows
+        )
+        await db.commit()
+    return await load_plan_catalog()
+
+async def reload_plans() -> PlanCatalog:
+    """Reload the active bot's plans from its plans file when it has one, else from the table"""
+    tenant = active_bot()
+    return await sync_plans_file(tenant.plans_file) if tenant.plans_file else await load_plan_catalog()
+
+async def watch_plans_file():
+    """Poll each bot's plans file mtime and sync it whenever it changes"""
+    last_mtimes = {}
+    while True:
+        for tenant in running_bots():
+            if not tenant.plans_file:
+                continue
+            with bot_context(tenant):
+                try:
+                    mtime = os.stat(tenant.plans_file).st_mtime
+                    if mtime != last_mtimes.get(tenant.key):
+                        await sync_plans_file(tenant.plans_file)
+                        last_mtimes[tenant.key] = mtime
+                except Exception as e:
+                    logger.error(f"Plans file sync failed: {e}", extra={"bot": tenant.key})
+        if await wait_for_shutdown(PLANS_FILE_POLL_SECONDS):
+            return
+
+def is_handled_update(data) -> bool:
+    """Cheap pre-check on the raw payload before building the Update object graph"""
+    if not isinstance(data, dict):
+        return False
+    
+    for update_type in HANDLED_UPDATE_TYPES:
+        payload = data.get(update_type)
+        if payload is None:
+            continue
+        # Only text messages and invoice receipts reach our message handlers
+        if update_type == "message" and "text" not in payload and "successful_payment" not in payload:
+            return False
+        return True
+    
+    return False
+
+def decode_webhook_body(body: bytes):
+    """Decode a webhook body, returning None for malformed or unhandled payloads"""
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    
+    return data if is_handled_update(data) else None
+
 @app.post("/telegram_webhook")
 async def telegram_webhook(request: Request):
+    return await handle_telegram_webhook(request, default_bot)
+
+@app.post("/telegram_webhook/{bot_key}")
+async def hosted_telegram_webhook(request: Request, bot_key: str):
+    tenant = bots.get(bot_key)
+    if tenant is None:
+        return Response(status_code=404)
+    return await handle_telegram_webhook(request, tenant)
+
+async def handle_telegram_webhook(request: Request, tenant: BotTenant):
+    # Reject junk traffic before reading the body
+    if tenant.webhook_secret_token:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), tenant.webhook_secret_token.encode()):
+            return Response(status_code=403)
+    
+    tenant.inflight_updates += 1
     try:
-        data = await request.json()
-        update = Update.de_json(data, bot_app.bot if bot_app else None)
+        application = tenant.application
+        if not application:
+            return {"ok": False, "error": "Bot not ready"}
         
-        if bot_app:
-            await bot_app.process_update(update)
+        data = decode_webhook_body(await request.body())
+        if data is None:
             return {"ok": True}
-        else:
-            return {"ok": False, "error": "Bot not ready"}
+        
+        correlation_id.set(data.get("update_id"))
+        if traffic_recorder:
+            traffic_recorder.record(data)
+        update = Update.de_json(data, application.bot)
+        with bot_context(tenant):
+            await application.process_update(update)
+        return {"ok": True}
             
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
+        logger.error("Webhook update failed", extra={"bot": tenant.key, "error": str(e)})
         return {"ok": False, "error": str(e)}
+    finally:
+        tenant.inflight_updates -= 1
+
+@app.post("/paystack_webhook")
+async def paystack_webhook(request: Request):
+    """Paystack event webhook; charge.success queues the grant for STK and checkout payments alike"""
+    with bot_context(default_bot):
+        return await handle_paystack_webhook(request)
+
+@app.post("/paystack_webhook/{bot_key}")
+async def hosted_paystack_webhook(request: Request, bot_key: str):
+    tenant = bots.get(bot_key)
+    if tenant is None:
+        return Response(status_code=404)
+    with bot_context(tenant):
+        return await handle_paystack_webhook(request)
+
+async def handle_paystack_webhook(request: Request):
+    body = await request.body()
+    signature = request.headers.get("x-paystack-signature", "")
+    
+    secret_key = active_bot().paystack_secret_key
+    if not secret_key:
+        return Response(status_code=503)
+    expected = hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+    if not hmac.compare_digest(signature.encode(), expected.encode()):
+        return Response(status_code=401)
+    
+    try:
+        event = orjson.loads(body)
+        if event.get("event") != "charge.success":
+            return {"ok": True}
+        
+        charge = event["data"]
+        reference = charge["reference"]
+        
+        payment = await active_bot().store.find_payment(reference)
+        
+        if not payment or not payment[1]:
+            logger.error("Paystack webhook for unknown payment", extra={"reference": reference})
+            return {"ok": True}
+        
+        user_id, plan_type, phone, amount, currency = payment
+        if charge.get("amount") != amount * 100 or charge.get("currency") != currency:
+            logger.error("Paystack webhook amount mismatch", extra={"reference": reference})
+            return {"ok": True}
+        
+        await save_card_authorization(user_id, charge)
+        await screen_card_charge(user_id, charge)
+        await record_successful_payment(user_id, plan_type, reference, phone)
+        logger.info("Payment confirmed by webhook", extra={"user_id": user_id, "reference": reference, "sampled": True})
+        return {"ok": True}
+        
+    except Exception as e:
+        logger.error("Paystack webhook failed", extra={"error": str(e)})
+        # Paystack retries on non-2xx responses
+        return Response(status_code=500)
+
+def is_admin_request(request: Request) -> bool:
+    if not ADMIN_API_TOKEN:
+        return False
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode())
+
+@app.post("/admin/profile/cpu")
+async def profile_cpu(request: Request, seconds: float = 10, interval_ms: float = 5):
+    """Sample the event loop thread for a time-boxed window and return collapsed stacks"""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    if cpu_profile_lock.locked():
+        return Response("Profile already running", status_code=409)
+    
+    async with cpu_profile_lock:
+        loop_thread = threading.get_ident()
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        stacks = await asyncio.to_thread(sample_cpu, loop_thread, seconds, max(interval_ms, 1) / 1000)
+    
+    logger.info("CPU profile taken", extra={"seconds": seconds, "samples": sum(stacks.values())})
+    return PlainTextResponse(collapsed(stacks))
+
+@app.post("/admin/profile/memory/start")
+async def profile_memory_start(request: Request, frames: int = 10):
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    await asyncio.to_thread(memory_profiler.start, frames)
+    return {"ok": True, "tracing": True}
+
+@app.post("/admin/profile/memory/stop")
+async def profile_memory_stop(request: Request):
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    await asyncio.to_thread(memory_profiler.stop)
+    return {"ok": True, "tracing": False}
+
+@app.get("/admin/profile/memory")
+async def profile_memory(request: Request, format: str = "diff", limit: int = 25):
+    """Diff against the previous snapshot, or collapsed allocation stacks with format=collapsed"""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    if not memory_profiler.running:
+        return Response("Start tracing with /admin/profile/memory/start first", status_code=409)
+    
+    if format == "collapsed":
+        return PlainTextResponse(await asyncio.to_thread(memory_profiler.collapsed_stacks))
+    
+    report = await asyncio.to_thread(memory_profiler.diff, limit)
+    report["objects"] = {
+        "user_sessions": sum(len(tenant.user_sessions) for tenant in bots.values()),
+        "channel_membership": sum(len(tenant.channel_membership) for tenant in bots.values()),
+        "expiry_timers": len(expiry_wheel),
+    }
+    return report
+
+@app.get("/admin/metrics")
+async def admin_metrics(request: Request):
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    return {
+        "loop": loop_watchdog.stats,
+        "inflight_updates": {tenant.key: tenant.inflight_updates for tenant in running_bots()},
+        "paystack_inflight": paystack_inflight,
+        "shed_flows": shed_count,
+        "velocity_keys": velocity_guard.stats(),
+        "dashboard": event_bus.stats(),
+        "user_sessions": sum(len(tenant.user_sessions) for tenant in bots.values()),
+        "expiry_timers": len(expiry_wheel),
+        "bots": [tenant.key for tenant in running_bots()],
+        "storage": {tenant.key: tenant.store.stats() for tenant in running_bots()},
+    }
+
+DASHBOARD_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Pouchon live</title>
+<style>
+body{font:14px monospace;margin:1em;background:#111;color:#ddd}
+#counts span{margin-right:1.5em} #log div{white-space:pre;border-bottom:1px solid #222}
+.payment_verified,.access_granted{color:#6c6} .velocity_flag,.dropped{color:#e66} .access_expired{color:#999}
+</style></head><body>
+<div id="counts"></div><div id="log"></div>
+<script>
+const counts = {}, log = document.getElementById("log");
+const source = new EventSource("/admin/events");
+["payment_created","payment_verified","access_granted","access_expired","velocity_flag","dropped"].forEach(type =>
+  source.addEventListener(type, e => {
+    counts[type] = (counts[type] || 0) + 1;
+    document.getElementById("counts").innerHTML =
+      Object.entries(counts).map(([k, v]) => `<span>${k}: ${v}</span>`).join("");
+    const row = document.createElement("div");
+    row.className = type;
+    row.textContent = new Date().toLocaleTimeString() + "  " + type + "  " + e.data;
+    log.prepend(row);
+    while (log.childElementCount > 500) log.lastChild.remove();
+  }));
+</script></body></html>"""
+
+DASHBOARD_LOGIN_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Pouchon live</title></head>
+<body style="font:14px monospace;margin:1em;background:#111;color:#ddd">
+<form method="post" action="/admin/dashboard">
+<input type="password" name="token" placeholder="Admin token" autofocus> <button>Open</button>
+</form></body></html>"""
+
+def sign_dashboard_session(expires: int) -> str:
+    signature = hmac.new(ADMIN_API_TOKEN.encode(), f"dashboard:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def has_dashboard_session(request: Request) -> bool:
+    session = request.cookies.get(DASHBOARD_COOKIE, "")
+    expires, _, _ = session.partition(".")
+    if not ADMIN_API_TOKEN or not expires.isdigit() or int(expires) <= time.time():
+        return False
+    return hmac.compare_digest(session.encode(), sign_dashboard_session(int(expires)).encode())
+
+def is_dashboard_request(request: Request) -> bool:
+    """Admin check that also accepts the session cookie, since EventSource cannot send headers"""
+    return has_dashboard_session(request) or is_admin_request(request)
+
+def dashboard_session_response(request: Request) -> Response:
+    """Redirect to the dashboard with a fresh signed session cookie"""
+    expires = int(time.time()) + DASHBOARD_SESSION_SECONDS
+    response = Response(status_code=303, headers={"Location": "/admin/dashboard"})
+    response.set_cookie(
+        DASHBOARD_COOKIE, sign_dashboard_session(expires), max_age=DASHBOARD_SESSION_SECONDS, path="/admin",
+        httponly=True, samesite="strict",
+        secure=request.url.scheme == "https" or request.headers.get("X-Forwarded-Proto") == "https"
+    )
+    return response
+
+@app.get("/admin/dashboard")
+async def admin_dashboard(request: Request):
+    if not ADMIN_API_TOKEN:
+        return Response(status_code=403)
+    if has_dashboard_session(request):
+        return HTMLResponse(DASHBOARD_HTML)
+    if is_admin_request(request):
+        return dashboard_session_response(request)
+    return HTMLResponse(DASHBOARD_LOGIN_HTML)
+
+@app.post("/admin/dashboard")
+async def admin_dashboard_login(request: Request):
+    """Exchange the admin token from the sign-in form for a session cookie"""
+    token = parse_qs((await request.body()).decode()).get("token", [""])[0]
+    if not ADMIN_API_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        return Response(status_code=403)
+    return dashboard_session_response(request)
+
+@app.get("/admin/events")
+async def admin_events(request: Request):
+    """Server-Sent Events stream of payments, grants, expiries and velocity flags"""
+    if not is_dashboard_request(request):
+        return Response(status_code=403)
+    
+    last_event_id = request.headers.get("Last-Event-ID")
+    subscription = event_bus.subscribe(int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+    
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            idle_since = time.monotonic()
+            while not (uvicorn_server and uvicorn_server.should_exit):
+                try:
+                    await asyncio.wait_for(subscription.wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - idle_since >= DASHBOARD_KEEPALIVE_SECONDS:
+                        idle_since = time.monotonic()
+                        yield b": keepalive\n\n"
+                    continue
+                idle_since = time.monotonic()
+                yield b"".join(subscription.drain())
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/admin/fraud")
+async def admin_fraud_events(request: Request, status: str = "open", limit: int = 100):
+    """Review queue of tripped velocity rules, newest first"""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    async with aiosqlite.connect(default_bot.database) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            "SELECT * FROM fraud_events WHERE status = ? ORDER BY id DESC LIMIT ?",
+            (status, min(max(limit, 1), 1000))
+        )
+        events = [dict(row) for row in await cursor.fetchall()]
+    return {"events": events, "blocked": sorted(velocity_guard.blocked)}
+
+@app.post("/admin/fraud/{event_id}/resolve")
+async def admin_resolve_fraud_event(request: Request, event_id: int, action: str = "clear"):
+    """Close a review entry; action=block also refuses the subject and its user from now on"""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    if action not in ("clear", "block"):
+        return JSONResponse({"ok": False, "error": "action must be clear or block"}, status_code=400)
+    
+    async with aiosqlite.connect(default_bot.database) as db:
+        cursor = await db.execute("SELECT subject, user_id FROM fraud_events WHERE id = ?", (event_id,))
+        event = await cursor.fetchone()
+        if not event:
+            return Response(status_code=404)
+        # Cards are only seen after payment, so blocking one also blocks the account that used it
+        subjects = {event[0], f"user:{event[1]}"}
+        await db.execute(
+            "UPDATE fraud_events SET status = ?, resolved_at = ? WHERE id = ?",
+            ("blocked" if action == "block" else "cleared", clock.now().isoformat(), event_id)
+        )
+        if action == "block":
+            await db.executemany(
+                "INSERT OR IGNORE INTO fraud_blocklist (subject, created_at) VALUES (?, ?)",
+                [(subject, clock.now().isoformat()) for subject in subjects]
+            )
+        await db.commit()
+    
+    if action == "block":
+        velocity_guard.blocked.update(subjects)
+    return {"ok": True, "subject": event[0], "action": action}
+
+@app.post("/admin/fraud/unblock")
+async def admin_unblock_subject(request: Request, subject: str):
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    async with aiosqlite.connect(default_bot.database) as db:
+        await db.execute("DELETE FROM fraud_blocklist WHERE subject = ?", (subject,))
+        await db.commit()
+    velocity_guard.blocked.discard(subject)
+    return {"ok": True, "subject": subject}
+
+@app.post("/admin/plans/reload")
+async def admin_reload_plans(request: Request, bot: str = DEFAULT_BOT_KEY):
+    """Re-read a bot's plans table (or its plans file, when set) without a restart"""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    tenant = bots.get(bot)
+    if tenant is None:
+        return JSONResponse({"ok": False, "error": f"Unknown bot {bot}"}, status_code=404)
+    try:
+        with bot_context(tenant):
+            catalog = await reload_plans()
+    except Exception as e:
+        logger.error(f"Plan reload error: {e}")
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    return {"ok": True, "offered": list(catalog.offered)}
 
 @app.get("/")
 async def root():
@@ -537,8 +2337,16 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "bot_ready": bot_app is not None}
+    return {
+        "status": "healthy",
+        "bot_ready": bool(running_bots()),
+        "bots": {key: tenant.application is not None for key, tenant in bots.items() if tenant.token},
+        "loop_lag_ms": loop_watchdog.stats["lag_ms_last"]
+    }
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # log_config=None keeps uvicorn's loggers on our queue handler
+    uvicorn_server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=port, log_config=None,
+                                                   timeout_graceful_shutdown=int(SHUTDOWN_DEADLINE_SECONDS)))
+    uvicorn_server.run()
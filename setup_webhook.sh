@@ -18,8 +18,18 @@ echo -e "🌐 Webhook URL: $WEBHOOK_URL"
 echo -e ""
 
 echo -e "${YELLOW}1. Setting Telegram webhook...${NC}"
-response=$(curl -s -X POST \
-  "https://api.telegram.org/bot$BOT_TOKEN/setWebhook?url=$WEBHOOK_URL")
+# Same update types as HANDLED_UPDATE_TYPES in pouchon_bot.py; queued payments are kept
+WEBHOOK_ARGS=(
+  -d "url=$WEBHOOK_URL"
+  -d 'allowed_updates=["message","callback_query","chat_member","pre_checkout_query"]'
+  -d "drop_pending_updates=false"
+)
+# The bot rejects webhook calls without this header when WEBHOOK_SECRET_TOKEN is set
+if [ -n "$WEBHOOK_SECRET_TOKEN" ]; then
+  WEBHOOK_ARGS+=(-d "secret_token=$WEBHOOK_SECRET_TOKEN")
+  echo -e "🔒 Secret token: set"
+fi
+response=$(curl -s -X POST "https://api.telegram.org/bot$BOT_TOKEN/setWebhook" "${WEBHOOK_ARGS[@]}")
 
 echo -e "Response:"
 echo "$response" | python3 -m json.tool 2>/dev/null || echo "$response"
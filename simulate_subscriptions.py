@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Subscription lifecycle simulator on a virtual clock
+Runs simulated users through subscribe -> pay -> grant -> join -> reminder ->
+expiry, with early top-ups, resubscribes, duplicate webhooks and card
+auto-renew, through the bot's own payment, grant, scheduler and renewal code.
+Telegram and Paystack are faked in-process and the bot reads a VirtualClock,
+so two days of subscriptions run in minutes of wall time.
+
+The loops the bot runs in the background are driven here one SCHEDULER_TICK_SECONDS
+step at a time, in order: user actions, grant dispatcher, renewals, expiry
+scheduler. Rate-limit pauses in the bot advance the clock instead of waiting.
+
+Every grant, invite link, reminder, removal and /status reply is checked
+against an independent model of what each user paid for, and the databases
+are compared with the model at the end; any mismatch fails the run. A table
+of scheduler and database cost per simulated hour is printed alongside.
+
+Usage:
+    python simulate_subscriptions.py                                  # 100k users, 48 simulated hours
+    python simulate_subscriptions.py --users 5000 --hours 24 --seed 7
+    STORAGE_BACKEND=sqlite-sharded python simulate_subscriptions.py --workdir /tmp/sim
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import heapq
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import aiosqlite
+import httpx
+import orjson
+from telegram import Chat, ChatInviteLink, ChatMemberLeft, ChatMemberMember, ChatMemberUpdated, Update, User
+
+import pouchon_bot
+from clock import VirtualClock
+from pouchon_bot import (
+    EXPIRY_REMINDER_MINUTES, GRANT_BATCH_SIZE, GRANT_POLL_SECONDS, RENEWAL_BATCH_SIZE, RENEWAL_INTERVAL_MINUTES,
+    SCHEDULER_TICK_SECONDS, bot_context, chat_member_handler, create_mpesa_charge, create_paystack_payment,
+    default_bot, dispatch_grant_batch, init_db, load_plan_catalog, record_pending_payment, run_expiry_tick,
+    run_renewal_batch, screen_payment_attempt, set_auto_renew, status_command
+)
+
+SIM_SECRET = "sk_simulated"
+BOT_USER_ID = 1
+FIRST_USER_ID = 10_000_000
+LINK_PATTERN = re.compile(r"https://t\.me/\+sim\d+")
+
+# Behaviour mix; each draw is seeded per user so the run does not depend on task interleaving
+KENYA_SHARE = 0.8
+ABANDON_RATE = 0.1
+DUPLICATE_WEBHOOK_RATE = 0.05
+JOIN_RATE = 0.7
+STATUS_RATE = 0.2
+TOP_UP_RATE = 0.1
+RESUBSCRIBE_RATE = 0.3
+AUTO_RENEW_RATE = 0.5
+RENEWAL_SUCCESS_RATE = 0.9
+
+class HourlyCost:
+    """Counters bucketed by simulated hour"""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.start = clock.time()
+        self.hours = defaultdict(Counter)
+
+    def count(self, name: str, amount: float = 1):
+        self.hours[int((self.clock.time() - self.start) // 3600)][name] += amount
+
+def instrument_sqlite(cost: HourlyCost):
+    """Count connections, statements and commits made through aiosqlite"""
+    connect = aiosqlite.connect
+
+    def counted_connect(*args, **kwargs):
+        cost.count("db_connections")
+        return connect(*args, **kwargs)
+
+    def counted(method, name):
+        def wrapper(self, *args, **kwargs):
+            cost.count(name)
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    aiosqlite.connect = counted_connect
+    aiosqlite.Connection.execute = counted(aiosqlite.Connection.execute, "db_statements")
+    aiosqlite.Connection.executemany = counted(aiosqlite.Connection.executemany, "db_statements")
+    aiosqlite.Connection.commit = counted(aiosqlite.Connection.commit, "db_commits")
+
+class SimUser:
+    __slots__ = ("user_id", "plan_type", "phone", "attempts", "paid", "granted", "expected", "auto_renew")
+
+    def __init__(self, user_id: int, plan_type: str):
+        self.user_id = user_id
+        self.plan_type = plan_type
+        self.phone = f"2547{user_id % 100_000_000:08d}"
+        self.attempts = 0
+        # Payments Paystack confirmed and grants the bot sent, which must end up equal
+        self.paid = 0
+        self.granted = 0
+        # Naive local datetime access should end at, per the model
+        self.expected = None
+        self.auto_renew = False
+
+class FakeTelegram:
+    """The Bot API calls the grant, scheduler and member handlers make, with channel state"""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.id = BOT_USER_ID
+        self.user = User(id=BOT_USER_ID, first_name="Pouchon", is_bot=True)
+        # invite link -> [channel_id, ChatInviteLink, uses, revoked]
+        self.links = {}
+        self.members = set()
+
+    async def create_chat_invite_link(self, chat_id, member_limit=None, expire_date=None, **kwargs):
+        self.sim.cost.count("telegram_calls")
+        if expire_date - self.sim.clock.now(timezone.utc) != timedelta(hours=12):
+            self.sim.error("invite link not valid for 12 hours", chat_id)
+        link = ChatInviteLink(
+            f"https://t.me/+sim{len(self.links)}", self.user, False, False, False,
+            expire_date=expire_date, member_limit=member_limit
+        )
+        self.links[link.invite_link] = [str(chat_id), link, 0, False]
+        return link
+
+    async def revoke_chat_invite_link(self, chat_id, invite_link, **kwargs):
+        self.sim.cost.count("telegram_calls")
+        self.links[invite_link][3] = True
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sim.cost.count("telegram_calls")
+        self.sim.on_message(chat_id, text)
+
+    async def ban_chat_member(self, chat_id, user_id, **kwargs):
+        self.sim.cost.count("telegram_calls")
+        self.sim.on_removed(user_id)
+        self.members.discard((user_id, str(chat_id)))
+
+    async def unban_chat_member(self, chat_id, user_id, **kwargs):
+        self.sim.cost.count("telegram_calls")
+
+class FakePaystack:
+    """httpx transport answering the charge endpoints the bot calls"""
+
+    def __init__(self, sim):
+        self.sim = sim
+        # reference -> charge request payload, for building its webhook
+        self.charges = {}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.sim.cost.count("paystack_calls")
+        payload = orjson.loads(request.content)
+        user = self.sim.users[payload["metadata"]["user_id"]]
+        path = request.url.path
+
+        if path.endswith("/transaction/charge_authorization"):
+            success = self.sim.chance(user.user_id, payload["reference"]) < RENEWAL_SUCCESS_RATE
+            if success:
+                user.paid += 1
+            status = "success" if success else "failed"
+            return httpx.Response(200, json={"status": True, "data": {"status": status, "reference": payload["reference"]}})
+
+        user.attempts += 1
+        reference = f"sim_{user.user_id}_{user.attempts}"
+        self.charges[reference] = payload
+        if path.endswith("/charge"):
+            return httpx.Response(200, json={"status": True, "data": {"reference": reference, "status": "pay_offline"}})
+        if path.endswith("/transaction/initialize"):
+            return httpx.Response(200, json={"status": True, "data": {
+                "reference": reference, "authorization_url": f"https://checkout.paystack.com/{reference}"
+            }})
+        return httpx.Response(404, json={"status": False, "message": "Unknown endpoint"})
+
+    def webhook(self, reference: str) -> bytes:
+        payload = self.charges[reference]
+        user_id = payload["metadata"]["user_id"]
+        if "mobile_money" in payload:
+            authorization = {"channel": "mobile_money", "reusable": False}
+        else:
+            authorization = {
+                "channel": "card", "reusable": True, "authorization_code": f"AUTH_{user_id}",
+                "signature": f"SIG_{user_id}", "brand": "visa", "last4": "4242"
+            }
+        return orjson.dumps({"event": "charge.success", "data": {
+            "reference": reference, "status": "success", "amount": payload["amount"],
+            "currency": payload["currency"], "customer": {"email": payload["email"]}, "authorization": authorization
+        }})
+
+class SimMessage:
+    """Stands in for update.message / callback query; keeps the last reply"""
+
+    def __init__(self, user_id: int):
+        self.message = self
+        self.effective_user = SimpleNamespace(id=user_id)
+        self.reply = None
+
+    async def reply_text(self, text, **kwargs):
+        self.reply = text
+
+    async def edit_message_reply_markup(self, **kwargs):
+        pass
+
+class Simulation:
+    def __init__(self, users: int, hours: float, arrival_hours: float, seed: int):
+        self.seed = seed
+        self.hours = hours
+        self.clock = VirtualClock(start=1_700_000_000.0)
+        self.cost = HourlyCost(self.clock)
+        self.telegram = FakeTelegram(self)
+        self.paystack = FakePaystack(self)
+        self.webhooks = httpx.AsyncClient(transport=httpx.ASGITransport(app=pouchon_bot.app), base_url="http://sim")
+        self.events = []
+        self.sequence = 0
+        self.errors = Counter()
+        self.error_examples = []
+        self.removal_lags = []
+        self.reminder_leads = []
+
+        rng = random.Random(seed)
+        self.users = {}
+        for number in range(users):
+            user_id = FIRST_USER_ID + number
+            plan_type = "kenya" if rng.random() < KENYA_SHARE else "international"
+            self.users[user_id] = SimUser(user_id, plan_type)
+            self.schedule(rng.uniform(0, arrival_hours * 3600), self.subscribe, user_id)
+
+    def chance(self, user_id: int, what: str) -> float:
+        return random.Random(f"{self.seed}:{user_id}:{what}").random()
+
+    def schedule(self, delay: float, action, *args):
+        self.sequence += 1
+        heapq.heappush(self.events, (self.clock.time() + delay, self.sequence, action, args))
+
+    def error(self, kind: str, user_id):
+        self.errors[kind] += 1
+        if len(self.error_examples) < 10:
+            self.error_examples.append(f"{kind}: user {user_id} at {self.clock.now().isoformat(timespec='seconds')}")
+
+    # User actions
+
+    async def subscribe(self, user_id: int):
+        user = self.users[user_id]
+        kenya = user.plan_type == "kenya"
+        phone = user.phone if kenya else None
+        if not await screen_payment_attempt(user_id, phone):
+            self.cost.count("refused")
+            return
+        if kenya:
+            reference = await create_mpesa_charge(user_id, user.plan_type, phone)
+        else:
+            _, reference = await create_paystack_payment(user_id, user.plan_type, None)
+        await record_pending_payment(reference, user_id, user.plan_type, phone)
+        self.cost.count("payments_started")
+
+        if self.chance(user_id, f"abandon:{reference}") < ABANDON_RATE:
+            return
+        delay = 10 + 80 * self.chance(user_id, f"pin:{reference}")
+        self.schedule(delay, self.deliver_webhook, reference, True)
+        # Paystack delivers at least once; some events arrive twice
+        if self.chance(user_id, f"duplicate:{reference}") < DUPLICATE_WEBHOOK_RATE:
+            self.schedule(delay + 30, self.deliver_webhook, reference, False)
+
+    async def deliver_webhook(self, reference: str, first: bool):
+        body = self.paystack.webhook(reference)
+        if first:
+            self.users[self.paystack.charges[reference]["metadata"]["user_id"]].paid += 1
+        signature = hmac.new(SIM_SECRET.encode(), body, hashlib.sha512).hexdigest()
+        response = await self.webhooks.post(
+            "/paystack_webhook", content=body,
+            headers={"x-paystack-signature": signature, "Content-Type": "application/json"}
+        )
+        if response.status_code != 200:
+            self.error(f"webhook answered {response.status_code}", reference)
+
+    async def join(self, user_id: int, invite_link: str):
+        channel_id, link, uses, revoked = self.telegram.links[invite_link]
+        if (user_id, channel_id) in self.telegram.members:
+            return
+        if revoked or link.expire_date <= self.clock.now(timezone.utc) or uses >= link.member_limit:
+            self.error("invite link unusable when joining", user_id)
+            return
+        self.telegram.links[invite_link][2] += 1
+        self.telegram.members.add((user_id, channel_id))
+
+        member = User(id=user_id, first_name="Sim", is_bot=False)
+        update = Update(0, chat_member=ChatMemberUpdated(
+            Chat(int(channel_id), Chat.CHANNEL), member, self.clock.now(timezone.utc),
+            ChatMemberLeft(member), ChatMemberMember(member), invite_link=link
+        ))
+        await chat_member_handler(update, SimpleNamespace(bot=self.telegram))
+
+    async def check_status(self, user_id: int):
+        user = self.users[user_id]
+        update = SimMessage(user_id)
+        await status_command(update, None)
+        remaining = user.expected - self.clock.now() if user.expected else timedelta(0)
+        if remaining > timedelta(0):
+            hours, minutes = divmod(int(remaining.total_seconds()) // 60, 60)
+            if f"Time left: {hours}h {minutes}m" not in (update.reply or ""):
+                self.error("/status shows wrong time left", user_id)
+        elif "No active access" not in (update.reply or ""):
+            self.error("/status shows access after expiry", user_id)
+
+    async def enable_auto_renew(self, user_id: int):
+        query = SimMessage(user_id)
+        await set_auto_renew(query, user_id, True)
+        self.users[user_id].auto_renew = "Auto-renew is on" in (query.reply or "")
+        if not self.users[user_id].auto_renew:
+            self.error("auto-renew could not be turned on", user_id)
+
+    # What the bot sends, checked against the model
+
+    def on_message(self, user_id: int, text: str):
+        user = self.users.get(user_id)
+        if user is None:
+            self.error("message to unknown chat", user_id)
+        elif text.startswith(("🎉 Welcome", "🔁 Access extended")):
+            self.on_grant(user, text)
+        elif text.startswith("⏰ Your access expires"):
+            self.cost.count("reminders")
+            lead = (user.expected - self.clock.now()).total_seconds()
+            self.reminder_leads.append(lead)
+            if lead > EXPIRY_REMINDER_MINUTES * 60:
+                self.error("reminder sent early", user_id)
+        elif text.startswith("⌛ Your access has expired"):
+            self.cost.count("expiries")
+            if user.expected > self.clock.now():
+                self.error("expiry notice before expiry", user_id)
+            elif user.granted < 3 and self.chance(user_id, f"resubscribe:{user.granted}") < RESUBSCRIBE_RATE:
+                self.schedule(12 * 3600 * self.chance(user_id, f"return:{user.granted}"), self.subscribe, user_id)
+        elif text.startswith("⚠️ Auto-renew payment failed"):
+            self.cost.count("renewals_declined")
+        else:
+            self.error(f"unexpected message {text[:30]!r}", user_id)
+
+    def on_grant(self, user: SimUser, text: str):
+        self.cost.count("grants")
+        user_id = user.user_id
+        if user.granted >= user.paid:
+            self.error("grant without a confirmed payment", user_id)
+        user.granted += 1
+
+        now = self.clock.now()
+        hours = default_bot.plan_catalog.plans[user.plan_type]["hours"]
+        user.expected = max(user.expected or now, now) + timedelta(hours=hours)
+        if text.startswith("🔁") and user.expected.strftime("%Y-%m-%d %H:%M") not in text:
+            self.error("extension shows wrong expiry", user_id)
+        if text.startswith("🎉"):
+            hours_left = max(round((user.expected - now).total_seconds() / 3600), 1)
+            if f"expires in {hours_left} hours" not in text:
+                self.error("welcome shows wrong hours left", user_id)
+
+        for invite_link in LINK_PATTERN.findall(text):
+            if invite_link not in self.telegram.links:
+                self.error("welcome carries an unknown link", user_id)
+            elif self.chance(user_id, invite_link) < JOIN_RATE:
+                self.schedule(30 + 1770 * self.chance(user_id, f"join:{invite_link}"), self.join, user_id, invite_link)
+
+        if user.granted == 1:
+            if self.chance(user_id, "status") < STATUS_RATE:
+                self.schedule(hours * 3600 * self.chance(user_id, "status_at"), self.check_status, user_id)
+            if self.chance(user_id, "top_up") < TOP_UP_RATE:
+                self.schedule(hours * 3600 * (0.5 + 0.4 * self.chance(user_id, "top_up_at")), self.subscribe, user_id)
+            if user.plan_type == "international" and self.chance(user_id, "auto_renew") < AUTO_RENEW_RATE:
+                self.schedule(60, self.enable_auto_renew, user_id)
+
+    def on_removed(self, user_id: int):
+        user = self.users[user_id]
+        lag = (self.clock.now() - user.expected).total_seconds()
+        if lag < 0:
+            self.error("removed from channel before expiry", user_id)
+        self.removal_lags.append(lag)
+
+    # The bot's background loops, one tick at a time
+
+    async def tick(self, next_poll: float, next_renewal: float):
+        due = []
+        while self.events and self.events[0][0] <= self.clock.time():
+            due.append(heapq.heappop(self.events))
+        if due:
+            results = await asyncio.gather(*(action(*args) for _, _, action, args in due), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    self.error(f"user action raised {type(result).__name__}: {result}", None)
+
+        started = time.perf_counter()
+        if pouchon_bot.grant_outbox_event.is_set() or self.clock.time() >= next_poll:
+            pouchon_bot.grant_outbox_event.clear()
+            while await dispatch_grant_batch() == GRANT_BATCH_SIZE:
+                pass
+            next_poll = self.clock.time() + GRANT_POLL_SECONDS
+        self.cost.count("dispatcher_ms", (time.perf_counter() - started) * 1000)
+
+        if self.clock.time() >= next_renewal:
+            while await run_renewal_batch() == RENEWAL_BATCH_SIZE:
+                pass
+            next_renewal = self.clock.time() + RENEWAL_INTERVAL_MINUTES * 60
+
+        started = time.perf_counter()
+        self.cost.count("timers_fired", await run_expiry_tick())
+        self.cost.count("scheduler_ms", (time.perf_counter() - started) * 1000)
+        return next_poll, next_renewal
+
+    async def run(self):
+        pouchon_bot.use_clock(self.clock)
+        pouchon_bot.grant_outbox_event = asyncio.Event()
+        pouchon_bot.http_client = httpx.AsyncClient(transport=httpx.MockTransport(self.paystack.handle))
+        instrument_sqlite(self.cost)
+
+        tenant = default_bot
+        tenant.paystack_secret_key = SIM_SECRET
+        tenant.application = SimpleNamespace(bot=self.telegram)
+        with bot_context(tenant):
+            await init_db()
+            await tenant.store.open()
+            await load_plan_catalog()
+            try:
+                end = self.clock.time() + self.hours * 3600
+                next_poll = next_renewal = next_tick = self.clock.time()
+                while self.clock.time() < end:
+                    next_tick += SCHEDULER_TICK_SECONDS
+                    self.clock.advance_to(next_tick)
+                    started = time.perf_counter()
+                    next_poll, next_renewal = await self.tick(next_poll, next_renewal)
+                    self.cost.count("wall_ms", (time.perf_counter() - started) * 1000)
+                    if (next_tick - self.cost.start) % (6 * 3600) == 0:
+                        print(f"   {(next_tick - self.cost.start) / 3600:>4.0f}h simulated, "
+                              f"{sum(user.granted for user in self.users.values())} grants", flush=True)
+                # Grants confirmed during the last tick
+                while await dispatch_grant_batch():
+                    pass
+                await self.verify()
+            finally:
+                await tenant.store.close()
+                await self.webhooks.aclose()
+                await pouchon_bot.http_client.aclose()
+
+    async def verify(self):
+        """Compare the bot's databases and the fake channel with the model"""
+        now = self.clock.now()
+        settled = now - timedelta(seconds=SCHEDULER_TICK_SECONDS)
+        async with aiosqlite.connect(default_bot.database) as db:
+            cursor = await db.execute("SELECT user_id, expires_at, active FROM subscriptions")
+            subscriptions = {user_id: (expires_at, active) for user_id, expires_at, active in await cursor.fetchall()}
+
+        for user in self.users.values():
+            if user.paid != user.granted:
+                self.error("confirmed payments and grants differ", user.user_id)
+            if not user.granted:
+                continue
+            expires_at, active = subscriptions.get(user.user_id, (None, None))
+            if expires_at != user.expected.isoformat():
+                self.error("stored expiry differs from paid time", user.user_id)
+            if user.expected <= settled and active:
+                self.error("still active after expiry", user.user_id)
+            if user.expected > now and not active:
+                self.error("inactive before expiry", user.user_id)
+            if user.expected <= settled and any((user.user_id, channel_id) in self.telegram.members
+                                                for channel_id in default_bot.plan_catalog.channels):
+                self.error("still in channel after expiry", user.user_id)
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def report(sim: Simulation, wall_seconds: float):
+    columns = ("payments_started", "grants", "reminders", "expiries", "timers_fired", "telegram_calls",
+               "db_connections", "db_statements", "db_commits", "dispatcher_ms", "scheduler_ms", "wall_ms")
+    headers = ("payments", "grants", "reminders", "expiries", "timers", "telegram",
+               "db conns", "db stmts", "commits", "grant ms", "sched ms", "wall ms")
+    print(f"{'hour':>4} " + " ".join(f"{header:>9}" for header in headers))
+    totals = Counter()
+    for hour in sorted(sim.cost.hours):
+        counters = sim.cost.hours[hour]
+        totals.update(counters)
+        print(f"{hour:>4} " + " ".join(f"{counters[column]:>9.0f}" for column in columns))
+    print(f"{'all':>4} " + " ".join(f"{totals[column]:>9.0f}" for column in columns))
+
+    payments = sum(user.paid for user in sim.users.values())
+    grants = sum(user.granted for user in sim.users.values())
+    print(f"\n⏱️  {sim.hours:g} simulated hours in {wall_seconds:.1f}s "
+          f"({sim.hours * 3600 / wall_seconds:.0f}x real time)")
+    print(f"💳 {payments} confirmed payments, {grants} grants, {totals['renewals_declined']:.0f} renewals declined, "
+          f"{totals['refused']:.0f} attempts refused by velocity rules")
+    print(f"🚪 Removal after expiry: p50 {percentile(sim.removal_lags, 0.5):.0f}s, "
+          f"p99 {percentile(sim.removal_lags, 0.99):.0f}s, max {max(sim.removal_lags, default=0):.0f}s")
+    print(f"⏰ Reminder before expiry: min {min(sim.reminder_leads, default=0) / 60:.1f} min, "
+          f"p50 {percentile(sim.reminder_leads, 0.5) / 60:.1f} min")
+    if sim.errors:
+        print(f"\n❌ {sum(sim.errors.values())} correctness errors")
+        for kind, count in sim.errors.most_common():
+            print(f"   {count:>7}  {kind}")
+        for example in sim.error_examples:
+            print(f"   e.g. {example}")
+    else:
+        print("\n✅ No correctness errors")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Simulate subscription lifecycles on a virtual clock")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--hours", type=float, default=48, help="Simulated hours to run")
+    parser.add_argument("--arrival-hours", type=float, default=24, help="Window new users arrive in")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="Keep the databases here instead of a temporary directory")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pouchon-sim-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    print(f"🧪 Simulating {args.users} users over {args.hours:g}h "
+          f"(seed {args.seed}, storage {os.getenv('STORAGE_BACKEND', 'sqlite')}, databases in {workdir})\n")
+
+    sim = Simulation(args.users, args.hours, args.arrival_hours, args.seed)
+    started = time.perf_counter()
+    await sim.run()
+    report(sim, time.perf_counter() - started)
+    return 1 if sim.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
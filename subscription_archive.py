@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Archive and compaction for subscriptions.db
+Old rows are moved into append-only gzip JSONL files partitioned by month:
+    archive/<table>/<YYYY-MM>.jsonl.gz
+
+Run directly to query the archive:
+    python subscription_archive.py payments --user-id 123456789
+    python subscription_archive.py subscriptions --since 2025-01 --until 2025-03
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# table -> (timestamp column used for retention and partitioning, extra WHERE clause, row identity)
+ARCHIVE_TABLES = {
+    "subscriptions": ("expires_at", "active = 0", ("user_id", "expires_at")),
+    "payments": ("created_at", "status != 'pending' OR created_at < :stale", ("reference",)),
+    "grant_outbox": ("created_at", "status != 'pending'", ("id",)),
+    # Replay guard for the outbox; entries are long finished by the retention cutoff
+    "applied_grants": ("applied_at", "1 = 1", ("payment_reference",)),
+}
+
+def append_rows(table: str, rows: list, timestamp_column: str, archive_dir: str = ARCHIVE_DIR):
+    """Append rows to their monthly archive files (blocking, run in a thread)"""
+    partitions = defaultdict(list)
+    for row in rows:
+        month = (row.get(timestamp_column) or "unknown")[:7]
+        partitions[month].append(row)
+
+    table_dir = os.path.join(archive_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+    for month, month_rows in partitions.items():
+        # Each append adds a gzip member; readers see one continuous stream
+        with gzip.open(os.path.join(table_dir, f"{month}.jsonl.gz"), "at", encoding="utf-8") as f:
+            for row in month_rows:
+                f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+async def archive_table(db, table: str, cutoff: datetime, batch_size: int, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Move rows older than cutoff into the archive in small delete batches"""
+    timestamp_column, condition, _ = ARCHIVE_TABLES[table]
+    params = {"cutoff": cutoff.isoformat(), "stale": (cutoff - timedelta(days=30)).isoformat()}
+    archived = 0
+
+    while True:
+        cursor = await db.execute(
+            f"SELECT rowid AS _rowid, * FROM {table} "
+            f"WHERE {timestamp_column} < :cutoff AND ({condition}) LIMIT {batch_size}",
+            params
+        )
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, values)) for values in await cursor.fetchall()]
+        if not rows:
+            return archived
+
+        rowids = [row.pop("_rowid") for row in rows]
+        # Rows are on disk before they are deleted; a crash in between only duplicates them
+        await asyncio.to_thread(append_rows, table, rows, timestamp_column, archive_dir)
+        # Re-check the condition so a row renewed since the SELECT is kept
+        await db.executemany(
+            f"DELETE FROM {table} WHERE rowid = :rowid AND {timestamp_column} < :cutoff AND ({condition})",
+            [dict(params, rowid=rowid) for rowid in rowids]
+        )
+        await db.commit()
+        archived += len(rows)
+
+        # Let request handlers take the write lock between batches
+        await asyncio.sleep(0)
+
+def iter_archive(table: str, since: str = None, until: str = None):
+    """Yield archived rows for a table, optionally limited to a YYYY-MM range, newest copy per key"""
+    table_dir = os.path.join(ARCHIVE_DIR, table)
+    if not os.path.isdir(table_dir):
+        return
+
+    key_columns = ARCHIVE_TABLES[table][2]
+    for filename in sorted(os.listdir(table_dir)):
+        month = filename.split(".")[0]
+        if (since and month < since) or (until and month > until):
+            continue
+        latest = {}
+        with gzip.open(os.path.join(table_dir, filename), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                latest[tuple(row.get(column) for column in key_columns)] = row
+        yield from latest.values()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query archived subscription data")
+    parser.add_argument("table", choices=sorted(ARCHIVE_TABLES))
+    parser.add_argument("--since", help="First month to include (YYYY-MM)")
+    parser.add_argument("--until", help="Last month to include (YYYY-MM)")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--reference", help="Payment reference")
+    parser.add_argument("--status")
+    parser.add_argument("--count", action="store_true", help="Only print the number of matching rows")
+    args = parser.parse_args()
+
+    matches = 0
+    for row in iter_archive(args.table, args.since, args.until):
+        if args.user_id is not None and row.get("user_id") != args.user_id:
+            continue
+        if args.reference and args.reference not in (row.get("reference"), row.get("payment_reference")):
+            continue
+        if args.status and row.get("status") != args.status:
+            continue
+        matches += 1
+        if not args.count:
+            print(json.dumps(row))
+
+    if args.count:
+        print(matches)
+
+if __name__ == "__main__":
+    sys.exit(main())
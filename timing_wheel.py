@@ -0,0 +1,109 @@
+"""
+Hierarchical timing wheel
+O(1) schedule/cancel for large numbers of timers (subscription reminders and expiries)
+"""
+
+import math
+from typing import Any, Dict, Hashable, List, Tuple
+
+class TimingWheel:
+    """
+    Timers are bucketed by deadline into wheels of increasing resolution.
+    Level 0 holds timers due within one rotation of `tick` seconds; each higher
+    level covers a full rotation of the level below and is cascaded down as time
+    passes. Timers beyond the last level wait in an overflow bucket.
+    """
+
+    def __init__(self, tick: float = 1.0, wheel_sizes: Tuple[int, ...] = (60, 60, 24, 64), start: float = 0.0):
+        self.tick = tick
+        self.wheel_sizes = wheel_sizes
+        # Resolution of each level in ticks: 1, 60, 3600, 86400 for the defaults
+        self.resolutions = [1]
+        for size in wheel_sizes[:-1]:
+            self.resolutions.append(self.resolutions[-1] * size)
+        self.horizon = self.resolutions[-1] * wheel_sizes[-1]
+
+        self.wheels = [[{} for _ in range(size)] for size in wheel_sizes]
+        self.overflow: Dict[Hashable, Tuple[int, Any]] = {}
+        self.index: Dict[Hashable, Dict] = {}
+        self.current = int(start // tick)
+        # Timers scheduled at or before the current tick, returned by the next advance()
+        self.ready: Dict[Hashable, Tuple[int, Any]] = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def schedule(self, key: Hashable, when: float, payload: Any = None):
+        """Schedule `key` to fire at unix time `when`, replacing any existing timer for it"""
+        self.cancel(key)
+        self._place(key, math.ceil(when / self.tick), payload)
+
+    def cancel(self, key: Hashable) -> bool:
+        bucket = self.index.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def advance(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """Move the wheel to unix time `now` and return (key, payload) for every timer that fired"""
+        target = int(now // self.tick)
+        due = []
+        if self.ready:
+            ready, self.ready = self.ready, {}
+            self._replace(ready, due)
+
+        while self.current < target:
+            self.current += 1
+
+            if self.current % self.horizon == 0 and self.overflow:
+                pending, self.overflow = self.overflow, {}
+                self._replace(pending, due)
+
+            # Cascade coarser levels first so their timers can land in this tick's slot
+            for level in range(len(self.wheel_sizes) - 1, 0, -1):
+                resolution = self.resolutions[level]
+                if self.current % resolution == 0:
+                    slot = (self.current // resolution) % self.wheel_sizes[level]
+                    bucket = self.wheels[level][slot]
+                    if bucket:
+                        self.wheels[level][slot] = {}
+                        self._replace(bucket, due)
+
+            slot = self.current % self.wheel_sizes[0]
+            bucket = self.wheels[0][slot]
+            if bucket:
+                self.wheels[0][slot] = {}
+                for key, (_, payload) in bucket.items():
+                    del self.index[key]
+                    due.append((key, payload))
+
+        return due
+
+    def _replace(self, bucket: Dict, due: List):
+        for key, (deadline, payload) in bucket.items():
+            del self.index[key]
+            if deadline <= self.current:
+                due.append((key, payload))
+            else:
+                self._place(key, deadline, payload)
+
+    def _place(self, key: Hashable, deadline: int, payload: Any):
+        delay = deadline - self.current
+        if delay <= 0:
+            bucket = self.ready
+        else:
+            bucket = self._bucket_for(deadline, delay)
+
+        bucket[key] = (deadline, payload)
+        self.index[key] = bucket
+
+    def _bucket_for(self, deadline: int, delay: int) -> Dict:
+        for level, size in enumerate(self.wheel_sizes):
+            resolution = self.resolutions[level]
+            if delay < size * resolution:
+                return self.wheels[level][(deadline // resolution) % size]
+        return self.overflow
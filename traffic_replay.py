@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Record and replay production webhook traffic
+
+Recording (in the bot): set TRAFFIC_RECORD_PATH and every handled update is
+appended, anonymized, to a gzip JSONL log with its arrival time.
+
+Replaying against a local instance with stubbed Telegram/Paystack:
+    python traffic_replay.py stub --port 8090 --latency 150
+    TELEGRAM_API_URL=http://localhost:8090/bot PAYSTACK_API_URL=http://localhost:8090/paystack \\
+        PAYSTACK_SECRET_KEY=sk_test BOT_TOKEN=1:stub python pouchon_bot.py
+    python traffic_replay.py replay recordings/traffic.jsonl.gz --speed 10
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+
+# 9+ digit runs in free text are treated as phone numbers
+PHONE_PATTERN = re.compile(r"\+?\d[\d\s\-]{7,}\d")
+ID_KEYS = {"id", "user_id", "chat_id"}
+NAME_KEYS = {"first_name", "last_name", "username", "title"}
+# Strings recorded as they are; every other string is replaced by a salted hash, so fields
+# Telegram adds later (payment charge ids, order info, invite links...) never reach disk raw
+KEPT_STRING_KEYS = {"type", "status", "language_code", "currency", "data", "mime_type"}
+# Free text keeps its shape for replay, with phone numbers masked
+MASKED_TEXT_KEYS = {"text", "caption", "phone_number"}
+
+class TrafficRecorder:
+    """Anonymize updates on the caller's thread and append them to disk from a writer thread"""
+
+    def __init__(self, path: str, salt: str):
+        self.path = path
+        self.salt = salt.encode()
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.thread = threading.Thread(target=self._write_loop, name="traffic-recorder", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def record(self, update: dict):
+        self.queue.put({"ts": round(time.time(), 3), "update": self.anonymize(update)})
+
+    def anonymize(self, value, key=None):
+        if isinstance(value, dict):
+            return {k: self.anonymize(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.anonymize(v) for v in value]
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, int):
+            return self.hash_id(value) if key in ID_KEYS or (key or "").endswith("chat_id") else value
+        if isinstance(value, float):
+            # Locations
+            return 0.0
+        if key in NAME_KEYS:
+            return "user"
+        if key in MASKED_TEXT_KEYS:
+            return PHONE_PATTERN.sub(self.mask_phone, value)
+        if key == "invoice_payload":
+            # The plan prefix is what the bot validates; the reference after it is per-user
+            plan_type, _, reference = value.partition(":")
+            return f"{plan_type}:{self.hash_text(reference)}" if reference else plan_type
+        if key in KEPT_STRING_KEYS:
+            return value
+        return self.hash_text(value)
+
+    def hash_id(self, value: int) -> int:
+        """Stable per-salt replacement that keeps the sign (channels/groups are negative)"""
+        digest = hashlib.blake2b(str(abs(value)).encode(), key=self.salt, digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big") % 10**10 + 10**9
+        return -hashed if value < 0 else hashed
+
+    def hash_text(self, value: str) -> str:
+        return "anon_" + hashlib.blake2b(str(value).encode(), key=self.salt, digest_size=8).hexdigest()
+
+    def mask_phone(self, match) -> str:
+        """Keep the prefix and length so replayed numbers still pass validation"""
+        phone = match.group(0)
+        digest = hashlib.blake2b(phone.encode(), key=self.salt, digest_size=16).hexdigest()
+        fake_digits = iter(str(int(digest, 16)))
+        keep = 5 if phone.startswith("+") else 4
+        return phone[:keep] + "".join(next(fake_digits) if c.isdigit() else c for c in phone[keep:])
+
+    def _write_loop(self):
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    return
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                if self.queue.empty():
+                    f.flush()
+
+def load_recording(path: str) -> list:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def update_user_id(update: dict):
+    for value in update.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"].get("id")
+    return None
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+async def replay(path: str, url: str, speed: float, secret_token: str, concurrency: int):
+    """Post recorded updates to a running instance, preserving their spacing divided by `speed`"""
+    import httpx
+
+    entries = load_recording(path)
+    if not entries:
+        print("❌ Recording is empty")
+        return False
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+    limit = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def send(client, update, previous):
+        nonlocal errors
+        # Updates from one user stay in order, as Telegram delivers them
+        if previous:
+            await previous
+        async with limit:
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=update, headers=headers)
+                if response.status_code != 200 or not response.json().get("ok"):
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    print(f"🔁 Replaying {len(entries)} updates to {url} at {'max' if not speed else f'{speed:g}x'} speed")
+    first_ts = entries[0]["ts"]
+    started = time.monotonic()
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        tasks, last_by_user = [], {}
+        for entry in entries:
+            if speed:
+                delay = (entry["ts"] - first_ts) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            user_id = update_user_id(entry["update"])
+            task = asyncio.create_task(send(client, entry["update"], last_by_user.get(user_id)))
+            last_by_user[user_id] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    print(f"   Updates:    {len(entries)} in {elapsed:.1f}s ({len(entries) / elapsed:.0f}/s)")
+    print(f"   Errors:     {errors}")
+    print(f"   Latency ms: p50={percentile(latencies, 0.5):.0f} "
+          f"p95={percentile(latencies, 0.95):.0f} p99={percentile(latencies, 0.99):.0f} "
+          f"max={max(latencies):.0f}")
+    return errors == 0
+
+def create_stub_app(latency_ms: float):
+    """Minimal Telegram Bot API and Paystack stand-ins returning well-formed success responses"""
+    from fastapi import FastAPI, Request
+
+    stub = FastAPI(title="Pouchon replay stub")
+    bot_user = {"id": 1000000001, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+
+    async def delay():
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+    @stub.post("/bot{token}/{method}")
+    async def telegram_method(method: str, request: Request):
+        await delay()
+        # python-telegram-bot posts url-encoded parameters unless uploading files
+        body = (await request.body()).decode()
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        method = method.lower()
+        chat = {"id": int(params.get("chat_id", 1) or 1), "type": "private"}
+        if method == "getme":
+            result = bot_user
+        elif method in ("sendmessage", "editmessagetext", "sendinvoice"):
+            result = {"message_id": 1, "date": int(time.time()), "chat": chat, "text": params.get("text", "")}
+        elif method == "createchatinvitelink":
+            result = {"invite_link": f"https://t.me/+{uuid.uuid4().hex[:16]}", "creator": bot_user,
+                      "creates_join_request": False, "is_primary": False, "is_revoked": False}
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    @stub.post("/paystack/transaction/initialize")
+    async def paystack_initialize():
+        await delay()
+        reference = uuid.uuid4().hex
+        return {"status": True, "data": {"authorization_url": f"https://checkout.stub/{reference}",
+                                         "reference": reference}}
+
+    @stub.get("/paystack/transaction/verify/{reference}")
+    async def paystack_verify(reference: str):
+        await delay()
+        return {"status": True, "data": {"status": "success", "reference": reference}}
+
+    @stub.post("/paystack/transaction/charge_authorization")
+    async def paystack_charge_authorization():
+        await delay()
+        return {"status": True, "data": {"status": "success", "reference": uuid.uuid4().hex}}
+
+    @stub.post("/paystack/charge")
+    async def paystack_charge():
+        await delay()
+        return {"status": True, "data": {"status": "pay_offline", "reference": uuid.uuid4().hex}}
+
+    return stub
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded webhook traffic")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser("replay", help="Drive a local instance with a recording")
+    replay_parser.add_argument("recording")
+    replay_parser.add_argument("--url", default="http://localhost:8080/telegram_webhook")
+    replay_parser.add_argument("--speed", default="1", help="Time compression factor, or 'max'")
+    replay_parser.add_argument("--secret-token", default=os.getenv("WEBHOOK_SECRET_TOKEN"))
+    replay_parser.add_argument("--concurrency", type=int, default=100)
+
+    stub_parser = subparsers.add_parser("stub", help="Run stub Telegram and Paystack APIs")
+    stub_parser.add_argument("--port", type=int, default=8090)
+    stub_parser.add_argument("--latency", type=float, default=0, help="Added latency per call in ms")
+
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        speed = 0 if args.speed == "max" else float(args.speed)
+        ok = asyncio.run(replay(args.recording, args.url, speed, args.secret_token, args.concurrency))
+        return 0 if ok else 1
+
+    import uvicorn
+    uvicorn.run(create_stub_app(args.latency), host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Payment velocity rules
+Counters are bucketed sliding windows kept in memory, so a check is a few dict
+operations and never touches the database. Each window is split into
+VELOCITY_BUCKETS buckets; counts are exact to within one bucket at the edge.
+State is snapshotted periodically so a restart does not reset the windows.
+"""
+
+import os
+from collections import namedtuple
+
+VELOCITY_BUCKETS = int(os.getenv("VELOCITY_BUCKETS", "12"))
+
+# event: what is counted; subject: who it is counted for; distinct: when set, count
+# distinct values of that subject instead of events (e.g. phones tried per user);
+# action: "block" refuses the attempt, "flag" only queues it for review
+Rule = namedtuple("Rule", "name event subject limit window action distinct")
+
+DEFAULT_RULES = (
+    Rule("user_attempts", "payment_attempt", "user",
+         int(os.getenv("VELOCITY_USER_ATTEMPTS", "5")), 600, "block", None),
+    Rule("phone_attempts", "payment_attempt", "phone",
+         int(os.getenv("VELOCITY_PHONE_ATTEMPTS", "5")), 3600, "block", None),
+    Rule("user_phones", "payment_attempt", "user",
+         int(os.getenv("VELOCITY_USER_PHONES", "3")), 3600, "block", "phone"),
+    Rule("card_users", "card_charge", "card",
+         int(os.getenv("VELOCITY_CARD_USERS", "2")), 86400, "flag", "user"),
+)
+
+class SlidingWindow:
+    """Per-key event counts (or distinct values) over the last `window` seconds"""
+
+    __slots__ = ("size", "bucket_seconds", "buckets", "distinct")
+
+    def __init__(self, window: float, distinct: bool = False, buckets: int = VELOCITY_BUCKETS):
+        self.size = buckets
+        self.bucket_seconds = window / buckets
+        # key -> {bucket: count}, or key -> {value: last bucket seen} when distinct
+        self.buckets = {}
+        self.distinct = distinct
+
+    def add(self, key, now: float, value=None) -> int:
+        """Record one event (or a value) for `key` and return the count in the window"""
+        bucket = int(now // self.bucket_seconds)
+        entries = self.buckets.setdefault(key, {})
+        if self.distinct:
+            entries[value] = bucket
+        else:
+            entries[bucket] = entries.get(bucket, 0) + 1
+        return self.count(key, now)
+
+    def count(self, key, now: float) -> int:
+        entries = self.buckets.get(key)
+        if not entries:
+            return 0
+        oldest = int(now // self.bucket_seconds) - self.size + 1
+        if self.distinct:
+            return sum(1 for bucket in entries.values() if bucket >= oldest)
+        return sum(count for bucket, count in entries.items() if bucket >= oldest)
+
+    def prune(self, now: float):
+        """Drop entries that have left the window"""
+        oldest = int(now // self.bucket_seconds) - self.size + 1
+        for key in list(self.buckets):
+            entries = self.buckets[key]
+            if self.distinct:
+                live = {value: bucket for value, bucket in entries.items() if bucket >= oldest}
+            else:
+                live = {bucket: count for bucket, count in entries.items() if bucket >= oldest}
+            if live:
+                self.buckets[key] = live
+            else:
+                del self.buckets[key]
+
+    def __len__(self):
+        return len(self.buckets)
+
+class VelocityGuard:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = tuple(rule for rule in rules if rule.limit > 0)
+        self.windows = {rule.name: SlidingWindow(rule.window, distinct=rule.distinct is not None) for rule in self.rules}
+        # "subject:value" strings refused outright (set from the review queue)
+        self.blocked = set()
+
+    def record(self, event: str, subjects: dict, now: float) -> list:
+        """Count an event and return (rule, subject_key, count, first_trip) for every rule over its limit"""
+        hits = []
+        for rule in self.rules:
+            if rule.event != event or subjects.get(rule.subject) is None:
+                continue
+            if rule.distinct and subjects.get(rule.distinct) is None:
+                continue
+            key = f"{rule.subject}:{subjects[rule.subject]}"
+            value = str(subjects[rule.distinct]) if rule.distinct else None
+            window = self.windows[rule.name]
+            previous = window.count(key, now)
+            count = window.add(key, now, value)
+            if count > rule.limit:
+                # Only the attempt that crosses the limit is worth a review entry
+                hits.append((rule, key, count, previous <= rule.limit))
+        return hits
+
+    def is_blocked(self, subjects: dict) -> bool:
+        return any(f"{subject}:{value}" in self.blocked for subject, value in subjects.items() if value is not None)
+
+    def prune(self, now: float):
+        for window in self.windows.values():
+            window.prune(now)
+
+    def snapshot(self) -> dict:
+        return {
+            name: [[key, list(entries.items())] for key, entries in window.buckets.items()]
+            for name, window in self.windows.items()
+        }
+
+    def restore(self, state: dict):
+        for name, keys in state.items():
+            window = self.windows.get(name)
+            if window is None:
+                continue
+            window.buckets = {key: dict((k, v) for k, v in entries) for key, entries in keys}
+
+    def stats(self) -> dict:
+        return {name: len(window) for name, window in self.windows.items()}